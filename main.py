@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import os
+import argparse
 import warnings
 import platform
 import json
 from datetime import datetime
-from openpyxl import load_workbook, Workbook
+from openpyxl import Workbook
 from prompt_toolkit import prompt
 from prompt_toolkit.application import Application, get_app
 from prompt_toolkit.key_binding import KeyBindings
@@ -16,13 +17,39 @@ from prompt_toolkit.styles import Style
 
 from utils.directory_utils import choose_working_directory, list_excel_files
 from utils.file_selection_utils import check_output_dir, choose_files
-from utils.sheet_utils import list_all_sheets, choose_sheet
+from utils.sheet_utils import choose_sheet
 from utils.user_input_utils import ask_number, choose_class_column
 from utils.split_utils import split_and_save
+from utils.shard_utils import select_shard, map_shard, merge_shards
+from utils.checkpoint_utils import has_checkpoint
+from utils.output_utils import get_staging_dir
+from utils.prefetch_utils import DEFAULT_READ_AHEAD
+from utils.filter_utils import compile_row_filter
+from utils.stats_utils import normalize_statistics_config
+from utils.partition_utils import normalize_partitions, safe_file_name
+from utils.duplicate_utils import normalize_duplicate_policy
+from utils.ranking_utils import normalize_ranking_config
+from utils.extent_utils import DEFAULT_MAX_EMPTY_ROWS
+from utils.multi_sheet_utils import normalize_extra_sheets
+from utils.compare_utils import normalize_compare_config
+from utils.session_utils import Session
 
 warnings.filterwarnings("ignore")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="年级成绩单拆分工具")
+    parser.add_argument("--resume", action="store_true", help="从上次中断的断点继续运行，跳过已完成的文件")
+    parser.add_argument("--map", metavar="中间文件", help="只提取数据并保存为中间文件，供之后合并")
+    parser.add_argument("--shard", metavar="K/N", help="与 --map 一起使用，只处理全部文件中的第K份（共N份）")
+    parser.add_argument("--merge", nargs="+", metavar="中间文件", help="合并多个中间文件并在当前目录生成班级文件")
+    args = parser.parse_args()
+    # 单独使用 --shard 只会生成一部分学科，删除模式下还会用它替换完整的"拆分"目录
+    if args.shard and not args.map:
+        parser.error("--shard 只能与 --map 一起使用")
+    return args
+
+
 def load_config():
     config_path = os.path.join(os.path.dirname(__file__), "config.json")
     if os.path.exists(config_path):
@@ -249,7 +276,7 @@ def ask_show_subject_header():
     return application.run()
 
 
-def show_completion_options(working_dir, stats):
+def show_completion_options(working_dir, stats, allow_again=False):
     os.system('cls' if os.name == 'nt' else 'clear')
     
     output_dir = os.path.join(working_dir, "拆分")
@@ -264,30 +291,52 @@ def show_completion_options(working_dir, stats):
             os.system(f"xdg-open '{output_dir}'")
         get_app().exit(result="open")
     
+    def on_again():
+        get_app().exit(result="again")
+    
     def on_exit():
         get_app().exit(result="exit")
     
     btn_open = Button(text="打开输出文件夹", handler=on_open_folder)
     btn_exit = Button(text="退出", handler=on_exit)
+    buttons = [btn_open, btn_exit]
+    if allow_again:
+        # 合并模式没有可以继续的会话，不显示该按钮
+        buttons.insert(1, Button(text="继续拆分", handler=on_again))
     
     style = Style.from_dict({
         "button.focused": "fg:ansiblue bg:ansiwhite",
     })
     
-    stats_labels = [
-        Label("处理完成!", dont_extend_height=True),
-        Window(height=1, char="-"),
-        Label(f"结果已保存在: {output_dir}", dont_extend_height=True),
+    if stats.get("unreplaced_files"):
+        # 输出目录中有文件被占用，部分新结果只保存在暂存目录中
+        result_labels = [
+            Label("处理完成，但部分文件未能替换!", dont_extend_height=True),
+            Window(height=1, char="-"),
+            Label(f"未能替换的文件数: {stats['unreplaced_files']}", dont_extend_height=True),
+            Label(f"未能替换的新文件保留在: {get_staging_dir(working_dir)}", dont_extend_height=True),
+        ]
+    else:
+        result_labels = [
+            Label("处理完成!", dont_extend_height=True),
+            Window(height=1, char="-"),
+            Label(f"结果已保存在: {output_dir}", dont_extend_height=True),
+        ]
+    
+    stats_labels = result_labels + [
         Window(height=1, char="="),
         Label("处理统计信息:", dont_extend_height=True),
         Label(f"  处理文件数: {stats['processed_files']}/{stats['total_files']}", dont_extend_height=True),
         Label(f"  跳过文件数: {stats['skipped_files']}", dont_extend_height=True),
         Label(f"  生成班级数: {stats['generated_classes']}", dont_extend_height=True),
+        Label(f"  其他划分文件数: {stats['partition_files']}", dont_extend_height=True),
+        Label(f"  去除重复行数: {stats['duplicate_rows']}", dont_extend_height=True),
         Label(f"  处理数据行数: {stats['total_rows']}", dont_extend_height=True),
+        Label(f"  断点恢复: {stats['resumed_files']} 个文件, {stats['resumed_classes']} 个班级", dont_extend_height=True),
         Window(height=1, char="="),
         Label("请选择操作:", dont_extend_height=True),
         Window(height=1, char="-"),
-        VSplit([btn_open, btn_exit], padding=3),
+        VSplit(buttons, padding=3),
     ]
     
     body = HSplit(stats_labels)
@@ -302,7 +351,49 @@ def show_completion_options(working_dir, stats):
     return application.run()
 
 
-def main():
+def run_merge(paths):
+    working_dir = "."
+    existing_files_action = check_output_dir(working_dir)
+    if not existing_files_action:
+        return
+    
+    os.system('cls' if os.name == 'nt' else 'clear')
+    try:
+        stats = merge_shards(paths, working_dir, existing_files_action)
+    except (OSError, ValueError) as e:
+        print(f"合并中间文件失败: {e}")
+        return
+    
+    result = show_completion_options(working_dir, stats)
+    if result == "open":
+        print("正在打开输出文件夹...")
+    elif result == "exit":
+        print("程序已退出。")
+
+
+def abort_run(session):
+    """
+    本次拆分因配置错误或未完成选择而无法继续时的返回值
+    会话中已完成过拆分时不结束程序，回到配置选择，修改配置后继续拆分，已解析的数据仍然保留
+    :param session: 交互会话
+    :return: 需要回到配置选择时返回 "again"，否则返回None
+    """
+    if not session.runs:
+        print("程序已退出。")
+        return None
+    # 配置选择界面会清屏，先让用户看到出错原因
+    prompt("按回车键返回配置选择...")
+    return "again"
+
+
+def run_once(args, session):
+    """
+    完成一次从选择配置到生成班级文件的交互流程
+    :param args: 命令行参数
+    :param session: 交互会话，多次拆分之间共享线程池和缓存
+    :return: 用户选择继续拆分时返回 "again"
+    """
+    # 每次都重新读取配置文件，修改配置后不需要重启程序
     config_data = load_config()
     
     config_choice = choose_config(config_data)
@@ -320,6 +411,124 @@ def main():
         else:
             print("配置选择无效，使用自定义配置。")
     
+    # 获取预配置中的行筛选条件，提前编译一次以便尽早发现配置错误
+    row_filters = None
+    if preset_config and preset_config.get("row_filters"):
+        row_filters = preset_config["row_filters"]
+        try:
+            compile_row_filter(row_filters)
+        except ValueError as e:
+            print(f"行筛选条件配置错误: {e}")
+            return abort_run(session)
+        print(f"使用预配置的行筛选条件: {len(row_filters)} 条")
+    
+    # 获取预配置中的总表设置，总表按学号连接各学科
+    wide_sheet = None
+    if preset_config and preset_config.get("wide_sheet"):
+        if preset_config.get("student_id_column") is None:
+            print("生成总表需要在预配置中指定学号列 student_id_column，本次将不生成总表。")
+        else:
+            wide_sheet = preset_config["wide_sheet"]
+            print("将在每个班级文件中生成总表sheet")
+    
+    # 获取预配置中的其他划分方式（如按教师、校区），与班级划分在同一次提取中完成
+    partitions = None
+    if preset_config and preset_config.get("partitions"):
+        partitions = preset_config["partitions"]
+        try:
+            normalize_partitions(partitions)
+        except ValueError as e:
+            print(f"划分配置错误: {e}")
+            return abort_run(session)
+        print(f"使用预配置的其他划分方式: {', '.join(p['name'] for p in partitions)}")
+    
+    # 获取预配置中的格式保留设置，默认保留列宽、数字格式和表头样式
+    preserve_format = True
+    if preset_config and "preserve_format" in preset_config:
+        preserve_format = preset_config["preserve_format"]
+    
+    # 获取预配置中的重复记录处理策略，未配置时不检测
+    duplicate_policy = None
+    if preset_config and preset_config.get("duplicates") is not None:
+        try:
+            duplicate_policy = normalize_duplicate_policy(preset_config["duplicates"])
+        except ValueError as e:
+            print(f"重复记录配置错误: {e}")
+            return abort_run(session)
+        print(f"使用预配置的重复记录处理策略: {duplicate_policy}")
+    
+    # 获取预配置中的排名设置
+    ranking = preset_config.get("ranking") if preset_config else None
+    if ranking:
+        try:
+            ranking_config = normalize_ranking_config(ranking)
+        except ValueError as e:
+            print(f"排名配置错误: {e}")
+            return abort_run(session)
+        print(f"使用预配置的排名: 按 {ranking_config['column']} 排名（{ranking_config['method']}）")
+    
+    # 获取预配置中的统计设置，未指定统计列时统计排名所用的成绩列
+    statistics = None
+    if preset_config and preset_config.get("statistics"):
+        statistics = preset_config["statistics"]
+        try:
+            normalize_statistics_config(statistics, ranking_config["column"] if ranking else None)
+        except ValueError as e:
+            print(f"统计配置错误: {e}")
+            return abort_run(session)
+        print("将在每个班级文件中生成统计sheet")
+    
+    # 获取预配置中的数据库输出文件名，与班级文件一起保存在"拆分"目录中
+    sqlite_output = None
+    if preset_config and preset_config.get("sqlite_output"):
+        sqlite_output = preset_config["sqlite_output"]
+        if not isinstance(sqlite_output, str) or safe_file_name(sqlite_output) != sqlite_output:
+            print(f"数据库文件名无效: {sqlite_output}")
+            return abort_run(session)
+        print(f"同时输出数据库: {sqlite_output}")
+    
+    # 获取预配置中的预读深度，工作目录位于网络共享或U盘时可适当调大，0表示不预读
+    read_ahead = DEFAULT_READ_AHEAD
+    if preset_config and "read_ahead" in preset_config:
+        read_ahead = preset_config["read_ahead"]
+        if not isinstance(read_ahead, int) or isinstance(read_ahead, bool) or read_ahead < 0:
+            print(f"预读深度配置无效: {read_ahead}")
+            return abort_run(session)
+    
+    # 获取预配置中需要额外提取的sheet，与主sheet在同一次打开工作簿时提取
+    extra_sheets = preset_config.get("extra_sheets") if preset_config else None
+    if extra_sheets:
+        try:
+            extra_sheet_config = normalize_extra_sheets(extra_sheets)
+        except ValueError as e:
+            print(f"额外sheet配置错误: {e}")
+            return abort_run(session)
+        print(f"同时提取额外sheet: {', '.join(spec['name'] for spec in extra_sheet_config)}")
+    
+    # 获取预配置中的考试对比设置，上次考试的数据直接从中间文件读取，不需要重新解析工作簿
+    compare = preset_config.get("compare") if preset_config else None
+    previous = None
+    if compare and preset_config.get("student_id_column") is None:
+        print("考试对比需要在预配置中指定学号列 student_id_column，本次将不进行对比。")
+        compare = None
+    if compare:
+        try:
+            compare_config = normalize_compare_config(compare)
+            if not args.map:
+                previous = session.load_previous_run(compare_config["previous"])
+        except (OSError, ValueError) as e:
+            print(f"考试对比配置错误: {e}")
+            return abort_run(session)
+        print(f"将与上次考试对比: {', '.join(compare_config['previous'])}")
+    
+    # 获取预配置中的连续空行上限，超过后认为数据已经结束，0表示不限制
+    max_empty_rows = DEFAULT_MAX_EMPTY_ROWS
+    if preset_config and "max_empty_rows" in preset_config:
+        max_empty_rows = preset_config["max_empty_rows"]
+        if not isinstance(max_empty_rows, int) or isinstance(max_empty_rows, bool) or max_empty_rows < 0:
+            print(f"连续空行上限配置无效: {max_empty_rows}")
+            return abort_run(session)
+    
     # 获取预配置中的自动检测目录设置
     auto_detect_directory = False
     if preset_config and "auto_detect_directory" in preset_config:
@@ -336,8 +545,8 @@ def main():
             print("程序已退出。")
             return
         if not working_dir:
-            print("未选择有效的工作目录，程序退出。")
-            return
+            print("未选择有效的工作目录。")
+            return abort_run(session)
         
         os.system('cls' if os.name == 'nt' else 'clear')
         print(f"工作目录: {os.path.abspath(working_dir)}")
@@ -347,8 +556,20 @@ def main():
     if preset_config and "existing_files_action" in preset_config:
         existing_files_action = preset_config["existing_files_action"]
     
-    if not check_output_dir(working_dir, existing_files_action):
-        return
+    # 续跑时保留输出目录中已完成的文件，不再询问如何处理；只对会话中的第一次拆分有效
+    resume_requested = args.resume and session.runs == 0
+    resume = resume_requested and has_checkpoint(get_staging_dir(working_dir))
+    if resume_requested and not resume:
+        print("未找到断点记录，将从头开始运行。")
+    if args.map:
+        # 只生成中间文件，不涉及输出目录
+        pass
+    elif resume:
+        existing_files_action = "delete" if existing_files_action == "delete" else "overwrite"
+    else:
+        existing_files_action = check_output_dir(working_dir, existing_files_action)
+        if not existing_files_action:
+            return
 
     os.system('cls' if os.name == 'nt' else 'clear')
     files = list_excel_files(working_dir)
@@ -366,12 +587,23 @@ def main():
         print("程序已退出。")
         return
     if not selected:
-        print("未选择文件，退出。")
-        return
+        print("未选择文件。")
+        return abort_run(session)
+    
+    if args.shard:
+        try:
+            selected = select_shard(selected, args.shard)
+        except ValueError as e:
+            print(e)
+            return abort_run(session)
+        print(f"分片 {args.shard}: 处理 {len(selected)} 个文件")
+        if not selected:
+            print("该分片没有文件。")
+            return abort_run(session)
 
     os.system('cls' if os.name == 'nt' else 'clear')
     first_file = os.path.join(working_dir, selected[0])
-    sheets = list_all_sheets(first_file)
+    sheets = session.list_sheets(first_file)
     
     if preset_config:
         sheet_index = preset_config["sheet_index"]
@@ -384,8 +616,17 @@ def main():
             print("程序已退出。")
             return
         if sheet_index is None:
-            print("未选择sheet，退出。")
-            return
+            print("未选择sheet。")
+            return abort_run(session)
+
+    # sheet确定后立即在后台解析所有已选文件，与后续的设置对话框并行进行
+    # 会话中之前已解析过且未修改的文件直接使用缓存
+    sheet_cache = session.sheet_cache(working_dir, read_ahead, max_empty_rows, preserve_format)
+    # 有额外sheet时以全部sheet序号为键，在同一次打开工作簿时一起解析
+    if extra_sheets:
+        sheet_cache.prefetch(selected, (sheet_index,) + tuple(spec["sheet_index"] for spec in extra_sheet_config))
+    else:
+        sheet_cache.prefetch(selected, sheet_index)
 
     os.system('cls' if os.name == 'nt' else 'clear')
     if preset_config:
@@ -398,10 +639,7 @@ def main():
             return
     
     os.system('cls' if os.name == 'nt' else 'clear')
-    wb = load_workbook(first_file, read_only=True, data_only=True)
-    ws = wb[sheet_name]
-    header_row_data = list(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True))[0]
-    wb.close()
+    header_row_data = session.read_header_row(first_file, sheet_name, header_row)
     
     print(f"表头行（第{header_row}行）的前10个单元格内容:")
     for i, cell in enumerate(header_row_data[:10]):
@@ -416,8 +654,8 @@ def main():
             print("程序已退出。")
             return
         if class_col is None:
-            print("未选择班级列，退出。")
-            return
+            print("未选择班级列。")
+            return abort_run(session)
 
     if preset_config:
         student_id_col = preset_config["student_id_column"]
@@ -453,14 +691,37 @@ def main():
             show_subject_header = True
 
     os.system('cls' if os.name == 'nt' else 'clear')
+    if args.map:
+        map_shard(selected, args.map, sheet_index, header_row, class_col, working_dir, student_id_col, ignore_class_col, show_subject_header, row_filters, statistics, wide_sheet, sheet_cache, partitions, preserve_format, duplicate_policy, sqlite_output, ranking, max_empty_rows, extra_sheets, compare)
+        return
+    
     print("开始拆分文件...")
-    stats = split_and_save(selected, sheet_index, sheet_name, header_row, class_col, working_dir, student_id_col, ignore_class_col, show_subject_header)
+    stats = split_and_save(selected, sheet_index, sheet_name, header_row, class_col, working_dir, student_id_col, ignore_class_col, show_subject_header, resume, existing_files_action, sheet_cache, row_filters, statistics, wide_sheet, partitions, preserve_format, duplicate_policy, sqlite_output, ranking, max_empty_rows, extra_sheets, compare, previous, session.executor)
+    session.runs += 1
     
-    result = show_completion_options(working_dir, stats)
+    result = show_completion_options(working_dir, stats, allow_again=True)
     if result == "open":
         print("正在打开输出文件夹...")
     elif result == "exit":
         print("程序已退出。")
+    return result
+
+
+def main():
+    args = parse_args()
+    
+    # 合并模式：所有参数都来自中间文件，不需要交互式设置
+    if args.merge:
+        run_merge(args.merge)
+        return
+    
+    # 完成后可以回到配置选择继续拆分，线程池和已解析的数据在整个会话中保留
+    session = Session()
+    try:
+        while run_once(args, session) == "again":
+            pass
+    finally:
+        session.close()
 
 
 if __name__ == "__main__":
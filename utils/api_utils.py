@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入式调用接口模块
+供其他Python程序直接调用拆分功能：输入可以是文件路径、字节串或文件对象，
+输出为内存中的班级工作簿，不读写工作目录和"拆分"目录，进度通过回调函数以事件字典报告
+
+用法示例:
+    from utils.api_utils import iter_split
+
+    for class_name, content in iter_split({"语文.xlsx": data}, sheet_index=0, header_row=2, class_col=3):
+        ...
+
+事件字典的 "type" 字段取值:
+    file_parsed      单个文件提取完成（file, subject, rows, seconds, cached, elapsed）
+    file_skipped     文件被跳过（file, error, elapsed）
+    sheet_skipped    文件中缺少额外sheet，只跳过该sheet（file, sheet, error, elapsed）
+    extraction_done  全部文件提取完成（files, rows, classes, elapsed）
+    class_written    单个班级工作簿生成完成（class, bytes, seconds, elapsed）
+    done             全部完成（stats, elapsed）
+"""
+
+import io
+import os
+import time
+from datetime import datetime
+
+from utils.split_utils import extract_and_merge, build_class_workbook
+from utils.extent_utils import DEFAULT_MAX_EMPTY_ROWS
+from utils.compare_utils import Comparison, normalize_compare_config
+from utils.shard_utils import load_previous_run
+
+
+def normalize_inputs(inputs):
+    """
+    将各种形式的输入统一为 [(文件名, 文件路径或文件对象)]
+    :param inputs: 文件路径列表、{文件名: 来源} 字典或 [(文件名, 来源)] 列表，
+                   来源可以是文件路径、bytes 或二进制文件对象；学科名取自文件名
+    :return: [(文件名, 文件路径或文件对象)]
+    """
+    if isinstance(inputs, dict):
+        items = list(inputs.items())
+    else:
+        items = []
+        for item in inputs:
+            if isinstance(item, (str, os.PathLike)):
+                items.append((os.path.basename(os.fspath(item)), item))
+            else:
+                items.append(tuple(item))
+
+    normalized = []
+    for name, source in items:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(bytes(source))
+        elif isinstance(source, os.PathLike):
+            source = os.fspath(source)
+        normalized.append((name, source))
+    return normalized
+
+
+def iter_split(inputs, sheet_index, header_row, class_col, student_id_col=None, ignore_class_col=False,
+               show_subject_header=True, row_filters=None, statistics=None, wide_sheet=None,
+               on_event=None, max_workers=None, partitions=None, preserve_format=True,
+               duplicate_policy=None, ranking=None, max_empty_rows=DEFAULT_MAX_EMPTY_ROWS,
+               extra_sheets=None, compare=None):
+    """
+    拆分成绩单并逐个生成班级工作簿
+    参数含义与 split_and_save 和预配置相同
+    :param inputs: 见 normalize_inputs
+    :param on_event: 可选，进度事件回调
+    :param partitions: 可选，班级以外的划分方式，其结果的名称为 "划分名称/分组键"
+    :param compare: 可选，考试对比配置，previous 为上次考试的中间文件路径
+    :return: 生成器，逐个产生 (班级名, xlsx文件内容bytes)
+    """
+    emit = on_event or (lambda event: None)
+    start_time = time.perf_counter()
+    # 上次考试的数据在提取之前读取，配置错误时不必等待提取完成
+    compare = normalize_compare_config(compare)
+    previous = None
+    if compare:
+        if student_id_col is None:
+            raise ValueError("考试对比需要指定学号列")
+        previous = load_previous_run(compare["previous"])
+    data = extract_and_merge(normalize_inputs(inputs), sheet_index, header_row, class_col, student_id_col,
+                             ignore_class_col, row_filters, statistics, wide_sheet,
+                             on_event=on_event, max_workers=max_workers, partitions=partitions,
+                             preserve_format=preserve_format, duplicate_policy=duplicate_policy,
+                             ranking=ranking, max_empty_rows=max_empty_rows, extra_sheets=extra_sheets,
+                             keep_student_ids=bool(compare))
+    if compare:
+        data.comparison = Comparison(data, previous, compare)
+
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    jobs = [(cls, cls, None) for cls in data.sorted_classes()]
+    for name in data.partition_data:
+        jobs.extend((f"{name}/{key}", key, name) for key in data.sorted_partition_keys(name))
+    for output_name, cls, partition in jobs:
+        class_start = time.perf_counter()
+        out_wb = build_class_workbook(data, cls, show_subject_header, current_date, partition)
+        if out_wb is None:
+            continue
+        buffer = io.BytesIO()
+        out_wb.save(buffer)
+        content = buffer.getvalue()
+        emit({"type": "class_written", "class": output_name, "bytes": len(content),
+              "seconds": time.perf_counter() - class_start, "elapsed": time.perf_counter() - start_time})
+        yield output_name, content
+
+    emit({"type": "done", "stats": data.stats, "elapsed": time.perf_counter() - start_time})
+
+
+def split_to_buffers(inputs, sheet_index, header_row, class_col, **kwargs):
+    """
+    拆分成绩单并返回全部班级工作簿
+    其他参数同 iter_split
+    :return: {班级名: 位于开头的 io.BytesIO}
+    """
+    return {cls: io.BytesIO(content)
+            for cls, content in iter_split(inputs, sheet_index, header_row, class_col, **kwargs)}
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+断点续跑工具模块
+记录已完成的提取结果和已写出的班级文件，使中断后的运行可以从断点继续
+"""
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+
+
+CHECKPOINT_DIR_NAME = ".checkpoint"
+JOURNAL_FILE_NAME = "journal.json"
+
+
+def get_checkpoint_dir(output_dir):
+    """
+    获取输出目录对应的断点目录
+    :param output_dir: 输出目录路径
+    :return: 断点目录路径
+    """
+    return os.path.join(output_dir, CHECKPOINT_DIR_NAME)
+
+
+def has_checkpoint(output_dir):
+    """
+    判断输出目录中是否存在可续跑的断点记录
+    :param output_dir: 输出目录路径
+    :return: 存在断点日志时返回True
+    """
+    return os.path.isfile(os.path.join(get_checkpoint_dir(output_dir), JOURNAL_FILE_NAME))
+
+
+def make_signature(params):
+    """
+    根据运行参数计算签名，参数不同的运行不能互相续跑
+    :param params: 可JSON序列化的参数字典
+    :return: 签名字符串
+    """
+    text = json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def read_journal(output_dir, signature):
+    """
+    读取可以续跑的断点日志
+    :param output_dir: 输出目录路径
+    :param signature: 本次运行的参数签名
+    :return: 断点日志字典；不存在、参数不一致或日志损坏时返回None
+    """
+    journal_path = os.path.join(get_checkpoint_dir(output_dir), JOURNAL_FILE_NAME)
+    if not os.path.isfile(journal_path):
+        return None
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            journal = json.load(f)
+        if journal.get("signature") == signature:
+            return journal
+        print("断点记录的参数与本次运行不一致，将重新开始。")
+    except Exception as e:
+        print(f"断点记录读取失败: {e}，将重新开始。")
+    return None
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+class Checkpoint:
+    """断点日志，记录提取结果缓存和已完成的班级文件"""
+
+    def __init__(self, output_dir, signature, resume=False):
+        self.checkpoint_dir = get_checkpoint_dir(output_dir)
+        self.journal_path = os.path.join(self.checkpoint_dir, JOURNAL_FILE_NAME)
+        self.signature = signature
+        self.journal = None
+
+        if resume:
+            self.journal = read_journal(output_dir, signature)
+
+        if self.journal is None:
+            # 丢弃旧的断点数据，从头开始记录
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+            self.journal = {"signature": signature, "extracted": {}, "written": {}}
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self._save_journal()
+
+    def _save_journal(self):
+        # 先写临时文件再替换，避免日志本身写到一半
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.journal, f, ensure_ascii=False)
+        os.replace(tmp_path, self.journal_path)
+
+    def _cache_path(self, file):
+        name = hashlib.sha1(file.encode("utf-8")).hexdigest()
+        return os.path.join(self.checkpoint_dir, f"{name}.pkl")
+
+    def load_extraction(self, file, full_file_path):
+        """
+        读取已缓存的提取结果，源文件有变化或缓存损坏时返回None
+        :param file: 文件名
+        :param full_file_path: 源文件完整路径
+        :return: process_single_file 的结果或None
+        """
+        entry = self.journal["extracted"].get(file)
+        if entry is None:
+            return None
+        try:
+            if entry["source"] != _file_stamp(full_file_path):
+                return None
+            with open(self._cache_path(file), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def save_extraction(self, file, full_file_path, result):
+        """
+        缓存单个文件的提取结果并记入日志
+        :param file: 文件名
+        :param full_file_path: 源文件完整路径
+        :param result: process_single_file 的结果
+        """
+        cache_path = self._cache_path(file)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        self.journal["extracted"][file] = {"source": _file_stamp(full_file_path)}
+        self._save_journal()
+
+    def is_written(self, cls, out_file):
+        """
+        判断班级文件是否已完整写出（文件存在且大小与记录一致）
+        :param cls: 班级名
+        :param out_file: 班级文件路径
+        :return: 已完整写出时返回True
+        """
+        entry = self.journal["written"].get(cls)
+        if entry is None or not os.path.isfile(out_file):
+            return False
+        return os.path.getsize(out_file) == entry["size"]
+
+    def mark_written(self, cls, out_file):
+        """
+        记录班级文件已写出
+        :param cls: 班级名
+        :param out_file: 班级文件路径
+        """
+        self.journal["written"][cls] = {"size": os.path.getsize(out_file)}
+        self._save_journal()
+
+    def finish(self):
+        """运行成功结束后删除断点数据"""
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+考试对比工具模块
+把本次运行的数据与上次考试的中间文件（--map 生成）按 (学科, 学号) 连接，
+上次的数据只需读取中间文件而不必重新解析工作簿，并在每个班级文件中生成"对比"sheet，
+列出每个学生各学科的成绩变化和名次变化
+"""
+
+from utils.ranking_utils import CLASS_RANK_TITLE, GRADE_RANK_TITLE
+from utils.stats_utils import score_value
+from utils.join_utils import student_id_sort_key
+
+
+COMPARE_SHEET_TITLE = "对比"
+
+DEFAULT_COMPARE = {
+    "previous": None,
+    "column": None,
+    "info_columns": ["姓名"],
+}
+
+
+def normalize_compare_config(compare):
+    """
+    规范化对比配置
+    :param compare: 包含 previous（上次的中间文件路径或路径列表）、column（成绩列名）、info_columns 的字典
+    :return: 完整的配置字典；不需要对比时返回None
+    """
+    if not compare:
+        return None
+    if not isinstance(compare, dict):
+        raise ValueError(f"对比配置应为对象: {compare}")
+    config = dict(DEFAULT_COMPARE)
+    config.update({k: v for k, v in compare.items() if k in DEFAULT_COMPARE})
+    previous = config["previous"]
+    if isinstance(previous, str):
+        previous = [previous]
+    if not previous or not all(isinstance(p, str) for p in previous):
+        raise ValueError("对比配置需要上次考试的中间文件路径 previous")
+    config["previous"] = list(previous)
+    if not config["column"]:
+        raise ValueError("对比配置需要指定成绩列名 column")
+    config["info_columns"] = list(config["info_columns"] or [])
+    return config
+
+
+def _column_positions(header, names):
+    header = list(header)
+    return [header.index(name) if name in header else None for name in names]
+
+
+def _value(row, index):
+    return row[index] if index is not None and index < len(row) else None
+
+
+def _difference(current, previous):
+    current, previous = score_value(current), score_value(previous)
+    if current is None or previous is None:
+        return None
+    return round(current - previous, 2)
+
+
+def _iter_scores(data, column):
+    """
+    逐行产生 (学科, 班级, 学号, 行, [成绩, 年级排名, 班级排名] 的列下标)
+    :param data: 已 finalize 且保存了学号的 SplitData
+    :param column: 成绩列名
+    """
+    for subject, header in data.subject_headers.items():
+        positions = _column_positions(header, [column, GRADE_RANK_TITLE, CLASS_RANK_TITLE])
+        if positions[0] is None:
+            continue
+        for class_name, subjects in data.class_data.items():
+            rows = subjects.get(subject)
+            if not rows:
+                continue
+            ids = data.student_ids.get(class_name, {}).get(subject, ())
+            for student_id, row in zip(ids, rows):
+                if student_id is not None:
+                    yield subject, class_name, student_id, row, positions
+
+
+class Comparison:
+    """本次与上次考试的对比结果：{班级: [对比行]}"""
+
+    def __init__(self, current, previous, config):
+        """
+        :param current: 本次已 finalize 的 SplitData
+        :param previous: 上次考试已 finalize 且保存了学号的 SplitData，见 shard_utils.load_previous_run
+        :param config: normalize_compare_config 的结果
+        """
+        column = config["column"]
+
+        # 上次考试的哈希索引：(学科, 学号) -> (成绩, 年级排名, 班级排名)
+        previous_index = {}
+        for subject, _, student_id, row, positions in _iter_scores(previous, column):
+            previous_index.setdefault((subject, student_id), tuple(_value(row, i) for i in positions))
+
+        self.has_ranks = any(GRADE_RANK_TITLE in header for header in current.subject_headers.values())
+        self.info_names = config["info_columns"]
+        self.column = column
+        self.matched = 0
+        self.unmatched = 0
+        self.class_rows = {}
+        for subject, class_name, student_id, row, positions in _iter_scores(current, column):
+            info = [_value(row, i) for i in _column_positions(current.subject_headers[subject], self.info_names)]
+            score, grade_rank, _ = (_value(row, i) for i in positions)
+            old = previous_index.get((subject, student_id))
+            if old is None:
+                self.unmatched += 1
+                old = (None, None, None)
+            else:
+                self.matched += 1
+            record = [student_id] + info + [subject, score, old[0], _difference(score, old[0])]
+            if self.has_ranks:
+                # 名次变化为正表示进步
+                record.extend([grade_rank, old[1], _difference(old[1], grade_rank)])
+            self.class_rows.setdefault(class_name, []).append(record)
+
+    def print_report(self):
+        """输出对比结果报告"""
+        print(f"\n考试对比: 匹配 {self.matched} 条记录，上次考试中没有的记录 {self.unmatched} 条")
+
+    def write_sheet(self, out_wb, cls, subjects):
+        """
+        在班级工作簿中写入对比sheet
+        :param out_wb: write_only 模式的班级工作簿
+        :param cls: 班级名
+        :param subjects: 按输出顺序排列的学科列表
+        """
+        rows = self.class_rows.get(cls)
+        if not rows:
+            return
+        subject_position = {subject: i for i, subject in enumerate(subjects)}
+        info_size = len(self.info_names)
+        rows = sorted(rows, key=lambda r: (student_id_sort_key(r[0]),
+                                           subject_position.get(r[1 + info_size], len(subjects))))
+
+        header = ["学号"] + self.info_names + ["学科", f"本次{self.column}", f"上次{self.column}", "变化"]
+        if self.has_ranks:
+            header.extend(["本次年级排名", "上次年级排名", "名次变化"])
+        ws = out_wb.create_sheet(title=COMPARE_SHEET_TITLE)
+        ws.append(header)
+        for row in rows:
+            ws.append(row)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+重复记录检测工具模块
+提取时为每个学科文件维护一个哈希索引：指定了学号列时以学号为键，否则以整行内容为键，
+每行只需一次字典查找。可以发现完全重复的行、同一学号成绩不同的行以及同一学号在不同班级的行，
+并按配置的策略保留第一条、保留最后一条或报错
+"""
+
+from utils.join_utils import normalize_student_id
+
+
+DUPLICATE_POLICIES = ("keep_first", "keep_last", "error")
+
+# 重复类型及其说明
+DUPLICATE_KINDS = {
+    "exact": "完全重复",
+    "score_conflict": "成绩不同",
+    "class_conflict": "班级不同",
+}
+
+# 报告中每种类型最多列出的记录数
+MAX_SAMPLES = 10
+
+
+def normalize_duplicate_policy(policy):
+    """
+    规范化重复记录处理策略
+    :param policy: "keep_first"、"keep_last"、"error"，或None表示不检测
+    :return: 策略名称或None
+    """
+    if policy is None:
+        return None
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"重复记录处理策略应为 {' / '.join(DUPLICATE_POLICIES)} 之一: {policy}")
+    return policy
+
+
+class DuplicateReport:
+    """重复记录统计：各类型的数量和部分示例"""
+
+    def __init__(self):
+        self.counts = {kind: 0 for kind in DUPLICATE_KINDS}
+        self.samples = {kind: [] for kind in DUPLICATE_KINDS}
+        self.dropped = 0
+
+    def __bool__(self):
+        return any(self.counts.values())
+
+    def add(self, kind, subject, key):
+        self.counts[kind] += 1
+        if len(self.samples[kind]) < MAX_SAMPLES:
+            self.samples[kind].append((subject, key))
+
+    def merge(self, other):
+        """合并另一份报告"""
+        for kind in DUPLICATE_KINDS:
+            self.counts[kind] += other.counts[kind]
+            room = MAX_SAMPLES - len(self.samples[kind])
+            if room > 0:
+                self.samples[kind].extend(other.samples[kind][:room])
+        self.dropped += other.dropped
+
+    def to_data(self):
+        """
+        转换为只包含基本类型的字典，用于保存中间文件
+        :return: 字典
+        """
+        return {"counts": self.counts, "samples": self.samples, "dropped": self.dropped}
+
+    @classmethod
+    def from_data(cls, state):
+        """
+        从 to_data 的结果恢复
+        :param state: to_data 的结果
+        :return: DuplicateReport
+        """
+        report = cls()
+        report.counts.update(state["counts"])
+        for kind, samples in state["samples"].items():
+            report.samples[kind] = [tuple(sample) for sample in samples]
+        report.dropped = state["dropped"]
+        return report
+
+    def print_report(self, policy):
+        """输出重复记录报告"""
+        if not self:
+            return
+        kept = "保留最后一条" if policy == "keep_last" else "保留第一条"
+        print(f"\n重复记录: 共去除 {self.dropped} 行（{kept}）")
+        for kind, label in DUPLICATE_KINDS.items():
+            if not self.counts[kind]:
+                continue
+            print(f"  {label} {self.counts[kind]} 处:")
+            for subject, key in self.samples[kind]:
+                print(f"    {subject}: {key}")
+
+
+def _classify(previous, current):
+    # 记录为 (班级, 原始行, 输出行)
+    if previous[0] != current[0]:
+        return "class_conflict"
+    if previous[2] != current[2]:
+        return "score_conflict"
+    return "exact"
+
+
+def filter_duplicates(records, subject, policy, student_id_col=None):
+    """
+    按策略去除单个学科文件中的重复记录，保持其余记录的原有顺序
+    :param records: (班级, 原始行, 输出行) 的可迭代对象
+    :param subject: 学科名，用于报告
+    :param policy: 处理策略，见 DUPLICATE_POLICIES
+    :param student_id_col: 可选，学号列号（从1开始）；未指定时以整行内容判断重复
+    :return: ((保留的记录列表, DuplicateReport), 错误信息)
+    """
+    report = DuplicateReport()
+    kept = []
+    # 键 -> 该键当前保留的记录在 kept 中的位置
+    seen = {}
+    id_index = student_id_col - 1 if student_id_col is not None else None
+
+    for record in records:
+        if id_index is None:
+            key = record[2]
+        else:
+            row = record[1]
+            key = normalize_student_id(row[id_index]) if id_index < len(row) else None
+            # 没有学号的行无法判断，全部保留
+            if key is None:
+                kept.append(record)
+                continue
+
+        position = seen.get(key)
+        if position is None:
+            seen[key] = len(kept)
+            kept.append(record)
+            continue
+
+        kind = _classify(kept[position], record)
+        shown_key = key if id_index is not None else "整行重复"
+        report.add(kind, subject, shown_key)
+        if policy == "error":
+            return None, f"学科 {subject} 中存在重复记录: {shown_key}（{DUPLICATE_KINDS[kind]}）"
+        report.dropped += 1
+        if policy == "keep_last":
+            # 先占位，最后统一去掉，避免在列表中间删除
+            kept[position] = None
+            seen[key] = len(kept)
+            kept.append(record)
+
+    if policy == "keep_last" and report.dropped:
+        kept = [record for record in kept if record is not None]
+    return (kept, report), None
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+数据范围工具模块
+源表曾对整列或远处的单元格设置过格式时，只读模式会把每行补齐到很大的列数，
+并遍历成千上万行带格式的空行。这里按实际数据确定范围：连续空行达到上限即停止读取，
+末尾空行和每行末尾多余的空单元格在保存之前去掉
+"""
+
+
+# 默认连续空行上限，超过后认为数据已经结束
+DEFAULT_MAX_EMPTY_ROWS = 200
+
+
+def is_empty_row(row):
+    """
+    判断一行是否没有任何数据
+    :param row: 数据行
+    :return: 所有单元格都为空时返回True
+    """
+    for value in row:
+        if value is not None and value != "":
+            return False
+    return True
+
+
+def trim_rows(rows, max_empty_rows=DEFAULT_MAX_EMPTY_ROWS):
+    """
+    在连续空行达到上限时停止读取，并去掉末尾的空行
+    中间的空行在遇到下一行数据时原样产生，保持行号不变
+    :param rows: 行迭代器
+    :param max_empty_rows: 连续空行上限；0或None表示不限制
+    :return: 行生成器
+    """
+    pending = []
+    for row in rows:
+        if row and not is_empty_row(row):
+            if pending:
+                yield from pending
+                pending = []
+            yield row
+            continue
+        pending.append(row)
+        if max_empty_rows and len(pending) >= max_empty_rows:
+            return
+
+
+def data_width(row):
+    """
+    计算一行最后一个非空单元格之后的位置
+    :param row: 数据行
+    :return: 有效宽度
+    """
+    for i in range(len(row) - 1, -1, -1):
+        value = row[i]
+        if value is not None and value != "":
+            return i + 1
+    return 0
+
+
+def trim_width(rows):
+    """
+    把所有行截断到整张表的实际数据宽度
+    :param rows: 行列表
+    :return: 截断后的行列表
+    """
+    width = max((data_width(row) for row in rows), default=0)
+    return [row[:width] if len(row) > width else row for row in rows]
@@ -7,11 +7,18 @@ from prompt_toolkit.widgets import CheckboxList, RadioList, Button, Label, Box
 from prompt_toolkit.layout.containers import HSplit, VSplit, Window
 from prompt_toolkit.styles import Style
 
+from utils.output_utils import get_output_dir
+
 
 def check_output_dir(working_dir=".", existing_files_action=None):
+    """
+    检查输出目录中的现有文件并确定处理方式
+    新结果写入暂存目录，这里不再删除任何文件，删除或覆盖在运行成功后替换目录时完成
+    :return: "delete" 或 "overwrite"；用户选择退出时返回False
+    """
     os.system('cls' if os.name == 'nt' else 'clear')
     
-    output_dir = os.path.join(working_dir, "拆分")
+    output_dir = get_output_dir(working_dir)
     os.makedirs(output_dir, exist_ok=True)
     
     # 检查目录中是否存在任何文件
@@ -19,7 +26,7 @@ def check_output_dir(working_dir=".", existing_files_action=None):
     
     # 如果目录为空，直接返回继续执行
     if not existing_files:
-        return True
+        return "delete"
     
     # 如果配置中已指定处理方式，则直接执行
     if existing_files_action:
@@ -27,18 +34,11 @@ def check_output_dir(working_dir=".", existing_files_action=None):
             print("根据预配置，退出程序以避免覆盖现有文件。")
             return False
         elif existing_files_action == "delete":
-            print("根据预配置，正在删除现有文件...")
-            for f in existing_files:
-                try:
-                    os.remove(os.path.join(output_dir, f))
-                    print(f"  已删除: {f}")
-                except Exception as e:
-                    print(f"  删除 {f} 失败: {e}")
-            print("所有现有文件已删除。")
-            return True
+            print("根据预配置，现有文件将在新结果生成后整体替换。")
+            return "delete"
         elif existing_files_action == "overwrite":
             print("根据预配置，将直接覆盖现有文件。")
-            return True
+            return "overwrite"
     
     # 如果目录不为空，显示提示并提供选项
     print(f"警告: 输出目录 '{output_dir}' 中已存在以下文件:")
@@ -91,18 +91,11 @@ def check_output_dir(working_dir=".", existing_files_action=None):
         print("用户选择退出程序，请自行处理输出目录中的文件。")
         return False
     elif choice == "delete":
-        print("正在删除现有文件...")
-        for f in existing_files:
-            try:
-                os.remove(os.path.join(output_dir, f))
-                print(f"  已删除: {f}")
-            except Exception as e:
-                print(f"  删除 {f} 失败: {e}")
-        print("所有现有文件已删除。")
-        return True
+        print("现有文件将在新结果生成后整体替换。")
+        return "delete"
     elif choice == "overwrite":
         print("用户选择直接覆盖现有文件。")
-        return True
+        return "overwrite"
     else:
         # 默认退出
         print("操作被取消。")
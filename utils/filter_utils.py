@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+行筛选工具模块
+将预配置中的声明式行筛选条件编译为判断函数，在提取数据时直接过滤行
+"""
+
+import operator
+
+
+_COMPARE_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+def _to_number(value):
+    # 数值和可解析为数值的文本统一转为float，其他返回None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _normalize(value):
+    # 集合匹配时使用的键：数值统一为float，文本去除首尾空白
+    number = _to_number(value)
+    if number is not None:
+        return number
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _compile_condition(condition):
+    try:
+        index = int(condition["column"]) - 1
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"筛选条件缺少有效的列号: {condition}")
+    if index < 0:
+        raise ValueError(f"筛选条件的列号必须从1开始: {condition}")
+    op = condition.get("op", "not_empty")
+
+    def cell(row):
+        return row[index] if index < len(row) else None
+
+    if op == "not_empty":
+        return lambda row: not _is_empty(cell(row))
+    if op == "empty":
+        return lambda row: _is_empty(cell(row))
+
+    if op in ("in", "not_in"):
+        if "values" not in condition:
+            raise ValueError(f"筛选条件 {op} 需要 values 列表: {condition}")
+        values = frozenset(_normalize(v) for v in condition["values"])
+        if op == "in":
+            return lambda row: _normalize(cell(row)) in values
+        return lambda row: _normalize(cell(row)) not in values
+
+    if op in _COMPARE_OPS:
+        if "value" not in condition:
+            raise ValueError(f"筛选条件 {op} 需要 value: {condition}")
+        compare = _COMPARE_OPS[op]
+        target = condition["value"]
+        target_number = _to_number(target)
+        if target_number is not None:
+            # 数值比较（value 写成 "60" 也按数值）：单元格无法转为数值时视为不满足条件
+            def test(row):
+                number = _to_number(cell(row))
+                return number is not None and compare(number, target_number)
+            return test
+        if op not in ("==", "!="):
+            # 按文本大小比较没有意义，"缺考" 会排在 "100" 之后
+            raise ValueError(f"筛选条件 {op} 的 value 必须是数值: {condition}")
+        target_text = str(target).strip()
+        return lambda row: not _is_empty(cell(row)) and compare(str(cell(row)).strip(), target_text)
+
+    raise ValueError(f"不支持的筛选运算符: {op}")
+
+
+def compile_row_filter(filters):
+    """
+    将筛选条件列表编译为单个判断函数，所有条件同时满足时保留该行
+    :param filters: 条件列表，如 [{"column": 5, "op": ">=", "value": 60}]
+    :return: 接收原始行元组并返回bool的函数；没有条件时返回None
+    """
+    if not filters:
+        return None
+    tests = tuple(_compile_condition(condition) for condition in filters)
+    if len(tests) == 1:
+        return tests[0]
+
+    def predicate(row):
+        for test in tests:
+            if not test(row):
+                return False
+        return True
+    return predicate
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+格式保留工具模块
+只读模式下无法直接获得列宽和样式，这里从源sheet的XML中只解析 <cols> 元素取得列宽，
+并读取表头行和第一行数据的单元格样式，每个学科只采集一次；写出时按列缓存样式，开销很小
+"""
+
+from copy import copy
+from xml.etree.ElementTree import fromstring, iterparse, tostring
+
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font
+from openpyxl.styles.fills import Fill
+from openpyxl.utils import get_column_letter
+
+
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+# 样式对象保存到中间文件时使用 OOXML 中的XML表示，不依赖openpyxl的类定义和版本
+_STYLE_TYPES = {
+    "font": Font,
+    "fill": Fill,
+    "border": Border,
+    "alignment": Alignment,
+}
+
+
+def read_column_widths(wb, ws):
+    """
+    读取只读模式工作表的列宽，解析到 <sheetData> 即停止，不会遍历数据
+    :param wb: 只读模式打开的工作簿
+    :param ws: 其中的工作表
+    :return: {列下标(从0开始): 列宽}
+    """
+    widths = {}
+    try:
+        with wb._archive.open(ws._worksheet_path) as src:
+            for _, element in iterparse(src, events=("start",)):
+                tag = element.tag
+                if tag == _SHEET_NS + "sheetData":
+                    break
+                if tag == _SHEET_NS + "col" and element.get("width"):
+                    width = float(element.get("width"))
+                    for col in range(int(element.get("min")), int(element.get("max")) + 1):
+                        # 整列格式可能覆盖到第16384列，只保留合理范围
+                        if col > 1024:
+                            break
+                        widths[col - 1] = width
+    except (AttributeError, KeyError, ValueError):
+        # 无法获得列宽时不影响拆分
+        return {}
+    return widths
+
+
+def _cell_style(cell):
+    if cell is None or not getattr(cell, "has_style", False):
+        return None
+    return {
+        "number_format": cell.number_format,
+        "font": copy(cell.font),
+        "fill": copy(cell.fill),
+        "border": copy(cell.border),
+        "alignment": copy(cell.alignment),
+    }
+
+
+def probe_sheet_format(wb, ws, max_row, max_col=None):
+    """
+    采集源sheet前几行的样式和列宽，不依赖表头行号
+    :param wb: 只读模式打开的工作簿
+    :param ws: 其中的工作表
+    :param max_row: 采集到第几行
+    :param max_col: 可选，采集到第几列；应为实际数据宽度，因格式产生的空列不采集样式
+    :return: {"widths": {...}, "rows": [[样式或None, ...], ...], "max_row": 采集到的行号, "max_col": 采集到的列号}
+    """
+    rows = []
+    if max_col != 0:
+        for row in ws.iter_rows(min_row=1, max_row=max_row, max_col=max_col):
+            rows.append([_cell_style(cell) for cell in row])
+    return {"widths": read_column_widths(wb, ws), "rows": rows, "max_row": max_row, "max_col": max_col}
+
+
+class SheetFormat:
+    """一个学科的输出格式：按输出列排列的列宽、表头样式和数据数字格式"""
+
+    def __init__(self, probe, header_row, kept_indexes):
+        """
+        :param probe: probe_sheet_format 的结果
+        :param header_row: 表头行号（从1开始）
+        :param kept_indexes: 输出列对应的源列下标（去掉学号列、班级列之后）
+        """
+        rows = probe["rows"]
+        header_styles = rows[header_row - 1] if len(rows) >= header_row else []
+        data_styles = rows[header_row] if len(rows) > header_row else []
+        widths = probe["widths"]
+
+        self.widths = {}
+        self.header_styles = {}
+        self.number_formats = {}
+        for out_idx, src_idx in enumerate(kept_indexes):
+            if src_idx in widths:
+                self.widths[out_idx] = widths[src_idx]
+            if src_idx < len(header_styles) and header_styles[src_idx]:
+                self.header_styles[out_idx] = header_styles[src_idx]
+            if src_idx < len(data_styles) and data_styles[src_idx]:
+                number_format = data_styles[src_idx]["number_format"]
+                if number_format and number_format != "General":
+                    self.number_formats[out_idx] = number_format
+
+    def __bool__(self):
+        return bool(self.widths or self.header_styles or self.number_formats)
+
+    def to_data(self):
+        """
+        转换为只包含基本类型的字典，用于保存中间文件
+        :return: 字典
+        """
+        header_styles = []
+        for out_idx, style in self.header_styles.items():
+            encoded = {name: tostring(style[name].to_tree(), encoding="unicode") for name in _STYLE_TYPES}
+            encoded["number_format"] = style["number_format"]
+            header_styles.append([out_idx, encoded])
+        return {
+            "widths": [[out_idx, width] for out_idx, width in self.widths.items()],
+            "header_styles": header_styles,
+            "number_formats": [[out_idx, fmt] for out_idx, fmt in self.number_formats.items()],
+        }
+
+    @classmethod
+    def from_data(cls, state):
+        """
+        从 to_data 的结果恢复
+        :param state: to_data 的结果
+        :return: SheetFormat
+        """
+        sheet_format = cls.__new__(cls)
+        sheet_format.widths = {out_idx: width for out_idx, width in state["widths"]}
+        sheet_format.header_styles = {}
+        for out_idx, encoded in state["header_styles"]:
+            style = {name: style_type.from_tree(fromstring(encoded[name]))
+                     for name, style_type in _STYLE_TYPES.items()}
+            style["number_format"] = encoded["number_format"]
+            sheet_format.header_styles[out_idx] = style
+        sheet_format.number_formats = {out_idx: fmt for out_idx, fmt in state["number_formats"]}
+        return sheet_format
+
+    def apply_widths(self, ws):
+        """设置列宽，write_only 模式下必须在写入第一行之前调用"""
+        for out_idx, width in self.widths.items():
+            ws.column_dimensions[get_column_letter(out_idx + 1)].width = width
+
+    def header_cells(self, ws, header):
+        """返回带样式的表头行"""
+        if not self.header_styles:
+            return header
+        cells = list(header)
+        for out_idx, style in self.header_styles.items():
+            if out_idx >= len(cells):
+                continue
+            cell = WriteOnlyCell(ws, value=cells[out_idx])
+            cell.font = style["font"]
+            cell.fill = style["fill"]
+            cell.border = style["border"]
+            cell.alignment = style["alignment"]
+            cell.number_format = style["number_format"]
+            cells[out_idx] = cell
+        return cells
+
+    def row_styler(self, ws):
+        """
+        生成数据行样式函数，每个数字格式只在输出工作簿中注册一次，之后只复制样式数组
+        :return: 接收数据行并返回可写入行的函数；没有数字格式时返回None
+        """
+        if not self.number_formats:
+            return None
+        styles = []
+        for out_idx, number_format in sorted(self.number_formats.items()):
+            template = WriteOnlyCell(ws)
+            template.number_format = number_format
+            styles.append((out_idx, template._style))
+
+        def styled(row):
+            cells = None
+            size = len(row)
+            for out_idx, style in styles:
+                if out_idx >= size:
+                    break
+                value = row[out_idx]
+                # 只对数值和日期应用数字格式，文本保持原样
+                if value is None or isinstance(value, str):
+                    continue
+                if cells is None:
+                    cells = list(row)
+                cell = WriteOnlyCell(ws, value=value)
+                cell._style = copy(style)
+                cells[out_idx] = cell
+            return row if cells is None else cells
+        return styled
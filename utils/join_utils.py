@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+跨学科连接工具模块
+提取时按学号为每个学科建立哈希索引，只保存选定的列，最后按学号连接生成每班一行一生的"总表"
+"""
+
+
+WIDE_SHEET_TITLE = "总表"
+
+DEFAULT_WIDE_SHEET = {
+    "columns": None,
+    "info_columns": [],
+}
+
+
+def normalize_wide_sheet_config(wide_sheet):
+    """
+    规范化总表配置
+    :param wide_sheet: True、False/None 或包含 columns、info_columns 的字典
+    :return: 完整的配置字典；不需要总表时返回None
+    """
+    if not wide_sheet:
+        return None
+    config = dict(DEFAULT_WIDE_SHEET)
+    if isinstance(wide_sheet, dict):
+        config.update({k: v for k, v in wide_sheet.items() if k in DEFAULT_WIDE_SHEET})
+    return config
+
+
+def normalize_student_id(value):
+    """
+    将学号统一为文本，避免不同文件中数字和文本格式的学号无法匹配
+    :param value: 单元格中的学号
+    :return: 学号文本；空值返回None
+    """
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def student_id_sort_key(student_id):
+    """
+    学号排序键：纯数字学号按数值排在前面，其他学号按文本排在后面
+    :param student_id: normalize_student_id 的结果
+    """
+    return (0, int(student_id), student_id) if student_id.isdigit() else (1, 0, student_id)
+
+
+class StudentIndex:
+    """单个学科文件的学号索引：学号 -> (班级, 信息列, 成绩列)"""
+
+    def __init__(self, header, student_id_col, class_col, columns=None, info_columns=()):
+        self.student_index = student_id_col - 1
+        info_columns = set(info_columns or ())
+        self.info_indexes = [i for i, name in enumerate(header) if name in info_columns]
+        if columns:
+            columns = set(columns)
+            self.value_indexes = [i for i, name in enumerate(header) if name in columns]
+        else:
+            # 未指定时连接除学号、班级和信息列以外的全部列
+            excluded = set(self.info_indexes) | {self.student_index, class_col - 1}
+            self.value_indexes = [i for i in range(len(header)) if i not in excluded]
+        self.value_names = [header[i] for i in self.value_indexes]
+        self.info_names = [header[i] for i in self.info_indexes]
+        self.index = {}
+        self.duplicates = []
+
+    def add(self, class_name, row):
+        """
+        将一行加入索引，同一学科中重复的学号只保留第一次出现的记录
+        :param class_name: 班级名
+        :param row: 原始数据行（投影前）
+        """
+        if self.student_index >= len(row):
+            return
+        student_id = normalize_student_id(row[self.student_index])
+        if student_id is None:
+            return
+        if student_id in self.index:
+            self.duplicates.append(student_id)
+            return
+        size = len(row)
+        self.index[student_id] = (
+            class_name,
+            tuple(row[i] if i < size else None for i in self.info_indexes),
+            tuple(row[i] if i < size else None for i in self.value_indexes),
+        )
+
+    def to_data(self):
+        """
+        转换为只包含基本类型的字典，用于保存中间文件
+        :return: 字典
+        """
+        return {
+            "student_index": self.student_index,
+            "info_indexes": self.info_indexes,
+            "value_indexes": self.value_indexes,
+            "value_names": self.value_names,
+            "info_names": self.info_names,
+            "index": [[student_id, class_name, info, values]
+                      for student_id, (class_name, info, values) in self.index.items()],
+            "duplicates": self.duplicates,
+        }
+
+    @classmethod
+    def from_data(cls, state):
+        """
+        从 to_data 的结果恢复
+        :param state: to_data 的结果
+        :return: StudentIndex
+        """
+        student_index = cls.__new__(cls)
+        for name in ("student_index", "info_indexes", "value_indexes", "value_names", "info_names", "duplicates"):
+            setattr(student_index, name, state[name])
+        student_index.index = {student_id: (class_name, tuple(info), tuple(values))
+                               for student_id, class_name, info, values in state["index"]}
+        return student_index
+
+
+class WideTable:
+    """按学号连接各学科索引，生成每班的总表"""
+
+    def __init__(self):
+        self.subject_indexes = {}
+        self.class_students = None
+        self.report = None
+        # 可选的总分排名：{学号: (总分, 班级排名, 年级排名)}
+        self.total_ranks = None
+
+    def add(self, subject, student_index):
+        """加入一个学科的学号索引"""
+        self.subject_indexes[subject] = student_index
+
+    def build(self, subjects):
+        """
+        确定每个学生所属班级，并统计缺失和冲突情况
+        :param subjects: 按输出顺序排列的学科列表
+        :return: 报告字典
+        """
+        subjects = [s for s in subjects if s in self.subject_indexes]
+        self.subjects = subjects
+        student_class = {}
+        class_conflicts = []
+        for subject in subjects:
+            for student_id, (class_name, _, _) in self.subject_indexes[subject].index.items():
+                first = student_class.setdefault(student_id, class_name)
+                if first != class_name:
+                    class_conflicts.append((student_id, subject, first, class_name))
+
+        self.class_students = {}
+        for student_id, class_name in student_class.items():
+            self.class_students.setdefault(class_name, []).append(student_id)
+        for students in self.class_students.values():
+            students.sort(key=student_id_sort_key)
+
+        missing = 0
+        for subject in subjects:
+            missing += len(student_class) - len(self.subject_indexes[subject].index)
+
+        self.report = {
+            "students": len(student_class),
+            "missing": missing,
+            "duplicates": [(subject, sid) for subject in subjects
+                           for sid in self.subject_indexes[subject].duplicates],
+            "class_conflicts": class_conflicts,
+        }
+        return self.report
+
+    def print_report(self):
+        """输出连接结果报告"""
+        report = self.report
+        print(f"\n总表: {report['students']} 名学生，缺失 {report['missing']} 条学科记录")
+        if report["duplicates"]:
+            print(f"  重复学号 {len(report['duplicates'])} 个（只保留第一条记录）:")
+            for subject, student_id in report["duplicates"][:10]:
+                print(f"    {subject}: {student_id}")
+        if report["class_conflicts"]:
+            print(f"  班级不一致的学号 {len(report['class_conflicts'])} 个（按第一个学科的班级归类）:")
+            for student_id, subject, first, other in report["class_conflicts"][:10]:
+                print(f"    {student_id}: {first} / {subject} 中为 {other}")
+
+    def write_sheet(self, out_wb, cls):
+        """
+        在班级工作簿中写入总表sheet
+        :param out_wb: write_only 模式的班级工作簿
+        :param cls: 班级名
+        """
+        students = self.class_students.get(cls)
+        if not students:
+            return
+        indexes = [self.subject_indexes[subject] for subject in self.subjects]
+        info_names = next((idx.info_names for idx in indexes if idx.info_names), [])
+
+        header = ["学号"] + list(info_names)
+        for subject, idx in zip(self.subjects, indexes):
+            header.extend(f"{subject}{name}" for name in idx.value_names)
+        if self.total_ranks is not None:
+            header.extend(["总分", "班级排名", "年级排名"])
+        header.append("缺失学科")
+
+        ws = out_wb.create_sheet(title=WIDE_SHEET_TITLE)
+        ws.append(header)
+        for student_id in students:
+            info = None
+            values = []
+            missing = []
+            for subject, idx in zip(self.subjects, indexes):
+                record = idx.index.get(student_id)
+                if record is None:
+                    values.extend([None] * len(idx.value_indexes))
+                    missing.append(subject)
+                    continue
+                if info is None and record[1]:
+                    info = record[1]
+                values.extend(record[2])
+            info = list(info or [None] * len(info_names))
+            info.extend([None] * (len(info_names) - len(info)))
+            if self.total_ranks is not None:
+                values.extend(self.total_ranks.get(student_id, (None, None, None)))
+            ws.append([student_id] + info[:len(info_names)] + values + ["、".join(missing)])
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+多sheet提取工具模块
+同一学科文件中的原始分、赋分、小题分等放在不同sheet时，预配置可以列出需要额外提取的sheet，
+每个sheet有自己的表头行、输出列和筛选条件。所有sheet在同一次打开工作簿时提取（共享字符串只解析一次），
+在班级文件中作为 "学科-名称" 的单独sheet输出
+"""
+
+from utils.filter_utils import compile_row_filter
+
+
+# 额外sheet的输出名称与学科名之间的分隔符
+SHEET_NAME_SEPARATOR = "-"
+
+
+def _check_column(value, key, spec):
+    # 列号从1开始，None表示未配置
+    if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+        raise ValueError(f"额外sheet配置中的 {key} 必须是从1开始的列号: {spec}")
+    return value
+
+
+def normalize_extra_sheets(extra_sheets):
+    """
+    规范化额外sheet配置
+    :param extra_sheets: [{"sheet_index": 1, "header_row": 2, "name": "赋分", "columns": [2, 5, 6],
+                          "class_column": 3, "student_id_column": 1, "row_filters": [...]}, ...]
+                         columns、class_column、student_id_column 可省略，省略时与主sheet相同或输出全部列；
+                         row_filters 可省略，其中的列号按该sheet自己的列计算，省略时不筛选
+    :return: [{"sheet_index", "header_row", "name", "columns", "class_col", "student_id_col", "row_filters"}]，
+             列号为从1开始；未配置时返回空列表
+    """
+    result = []
+    names = set()
+    for spec in extra_sheets or ():
+        if not isinstance(spec, dict):
+            raise ValueError(f"额外sheet配置应为对象: {spec}")
+        sheet_index = spec.get("sheet_index")
+        header_row = spec.get("header_row")
+        name = spec.get("name")
+        if isinstance(sheet_index, bool) or not isinstance(sheet_index, int) or sheet_index < 0:
+            raise ValueError(f"额外sheet配置需要从0开始的 sheet_index: {spec}")
+        if isinstance(header_row, bool) or not isinstance(header_row, int) or header_row < 1:
+            raise ValueError(f"额外sheet配置需要从1开始的 header_row: {spec}")
+        if not name or not isinstance(name, str):
+            raise ValueError(f"额外sheet配置需要输出名称 name: {spec}")
+        if name in names:
+            raise ValueError(f"额外sheet名称重复: {name}")
+        names.add(name)
+
+        columns = spec.get("columns")
+        if columns is not None:
+            if not isinstance(columns, list) or not columns or None in columns:
+                raise ValueError(f"额外sheet配置中的 columns 必须是列号列表: {spec}")
+            columns = [_check_column(c, "columns", spec) for c in columns]
+        row_filters = spec.get("row_filters")
+        if row_filters is not None:
+            if not isinstance(row_filters, list):
+                raise ValueError(f"额外sheet配置中的 row_filters 必须是条件列表: {spec}")
+            # 提前编译一次以便尽早发现配置错误
+            compile_row_filter(row_filters)
+        result.append({
+            "sheet_index": sheet_index,
+            "header_row": header_row,
+            "name": name,
+            "columns": columns,
+            "class_col": _check_column(spec.get("class_column"), "class_column", spec),
+            "student_id_col": _check_column(spec.get("student_id_column"), "student_id_column", spec),
+            "row_filters": row_filters,
+        })
+    return result
+
+
+def build_sheet_specs(sheet_index, header_row, class_col, student_id_col, extra_sheets, row_filter=None):
+    """
+    组合主sheet和额外sheet的提取参数
+    主sheet的筛选条件按主sheet的列计算，不用于额外sheet；额外sheet只使用自己配置的筛选条件
+    :param extra_sheets: normalize_extra_sheets 的结果
+    :param row_filter: 可选，主sheet已编译的筛选函数
+    :return: [(输出名称后缀, sheet序号, 表头行, 班级列, 学号列, 输出列或None, 筛选函数或None)]，
+             主sheet在最前面且后缀为空
+    """
+    specs = [("", sheet_index, header_row, class_col, student_id_col, None, row_filter)]
+    for spec in extra_sheets:
+        specs.append((
+            SHEET_NAME_SEPARATOR + spec["name"],
+            spec["sheet_index"],
+            spec["header_row"],
+            spec["class_col"] or class_col,
+            spec["student_id_col"] if spec["student_id_col"] is not None else student_id_col,
+            spec["columns"],
+            compile_row_filter(spec["row_filters"]),
+        ))
+    return specs
+
+
+def sheet_indexes(specs):
+    """
+    提取时需要读取的sheet序号，用作预解析缓存的键
+    :param specs: build_sheet_specs 的结果
+    :return: sheet序号元组
+    """
+    return tuple(spec[1] for spec in specs)
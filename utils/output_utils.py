@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+输出目录工具模块
+新结果先写入同级的暂存目录，运行成功后再整体替换输出目录，旧结果在后台删除
+"""
+
+import os
+import time
+import shutil
+import threading
+
+
+OUTPUT_DIR_NAME = "拆分"
+STAGING_SUFFIX = ".staging"
+OLD_SUFFIX = ".old-"
+
+
+def get_output_dir(working_dir="."):
+    """
+    获取最终输出目录
+    :param working_dir: 工作目录
+    :return: 输出目录路径
+    """
+    return os.path.join(working_dir, OUTPUT_DIR_NAME)
+
+
+def get_staging_dir(working_dir="."):
+    """
+    获取与输出目录同级的暂存目录
+    :param working_dir: 工作目录
+    :return: 暂存目录路径
+    """
+    return get_output_dir(working_dir) + STAGING_SUFFIX
+
+
+def prepare_staging(working_dir=".", resume=False):
+    """
+    准备暂存目录，非续跑时清空上次中断遗留的内容
+    :param working_dir: 工作目录
+    :param resume: 是否续跑
+    :return: 暂存目录路径
+    """
+    staging_dir = get_staging_dir(working_dir)
+    if not resume:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir, exist_ok=True)
+    return staging_dir
+
+
+def _remove_in_background(paths):
+    # 非守护线程：程序退出前会等待删除完成，但不阻塞后续流程
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths:
+        return None
+    def worker():
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+    thread = threading.Thread(target=worker, name="old-output-cleanup")
+    thread.start()
+    return thread
+
+
+def cleanup_old_generations(working_dir="."):
+    """
+    在后台删除之前运行遗留的旧结果目录
+    :param working_dir: 工作目录
+    :return: 删除线程，无需删除时返回None
+    """
+    prefix = OUTPUT_DIR_NAME + OLD_SUFFIX
+    try:
+        names = os.listdir(working_dir)
+    except OSError:
+        return None
+    return _remove_in_background([os.path.join(working_dir, n) for n in names if n.startswith(prefix)])
+
+
+def _carry_over(src_dir, dst_dir):
+    # 子目录（其他划分方式的输出）两边都存在时逐个文件合并
+    for f in os.listdir(src_dir):
+        src = os.path.join(src_dir, f)
+        dst = os.path.join(dst_dir, f)
+        if os.path.isdir(src) and os.path.isdir(dst):
+            _carry_over(src, dst)
+        elif not os.path.exists(dst):
+            try:
+                os.replace(src, dst)
+            except OSError as e:
+                print(f"  保留旧文件 {f} 失败: {e}")
+
+
+def _replace_into(src_dir, dst_dir, prefix=""):
+    # 逐个文件覆盖到输出目录，子目录（其他划分方式的输出）两边都存在时递归合并
+    failed = []
+    for f in os.listdir(src_dir):
+        src = os.path.join(src_dir, f)
+        dst = os.path.join(dst_dir, f)
+        name = prefix + f
+        if os.path.isdir(src) and os.path.isdir(dst):
+            failed.extend(_replace_into(src, dst, name + os.sep))
+            continue
+        try:
+            os.replace(src, dst)
+        except OSError as err:
+            print(f"  替换 {name} 失败: {err}")
+            failed.append(name)
+    return failed
+
+
+def _remove_stale(dst_dir, src_dir, prefix=""):
+    # 删除输出目录中本次没有生成的旧文件和子目录，两边都存在的子目录递归处理
+    failed = []
+    for f in os.listdir(dst_dir):
+        src = os.path.join(src_dir, f)
+        dst = os.path.join(dst_dir, f)
+        name = prefix + f
+        if os.path.isdir(dst) and os.path.isdir(src):
+            failed.extend(_remove_stale(dst, src, name + os.sep))
+            continue
+        if os.path.exists(src):
+            continue
+        try:
+            if os.path.isdir(dst):
+                shutil.rmtree(dst)
+            else:
+                os.remove(dst)
+        except OSError as err:
+            print(f"  删除旧文件 {name} 失败: {err}")
+            failed.append(name)
+    return failed
+
+
+def commit_staging(working_dir=".", keep_existing=False):
+    """
+    用暂存目录整体替换输出目录
+    输出目录无法整体替换时逐个文件替换，有文件替换失败时保留暂存目录，新结果不会丢失；
+    删除模式下同时删除本次未生成的旧文件
+    :param working_dir: 工作目录
+    :param keep_existing: 是否保留旧输出中本次未生成的文件（覆盖模式）
+    :return: 未能替换或未能删除的文件列表（相对于输出目录），全部成功时为空列表
+    """
+    output_dir = get_output_dir(working_dir)
+    staging_dir = get_staging_dir(working_dir)
+
+    if keep_existing and os.path.isdir(output_dir):
+        # 覆盖模式：把本次没有生成的旧文件移入暂存目录（同一文件系统内重命名，几乎无开销）
+        _carry_over(output_dir, staging_dir)
+
+    old_dir = None
+    if os.path.isdir(output_dir):
+        old_dir = output_dir + OLD_SUFFIX + time.strftime("%Y%m%d%H%M%S")
+        try:
+            os.rename(output_dir, old_dir)
+        except OSError as e:
+            # 旧目录被占用（如文件在Excel中打开）时无法整体替换，退回到逐个文件替换
+            print(f"无法替换输出目录: {e}，将逐个替换文件。")
+            # 删除模式下本次没有生成的旧文件也要删除，与整体替换的结果一致
+            stale = [] if keep_existing else _remove_stale(output_dir, staging_dir)
+            failed = _replace_into(staging_dir, output_dir)
+            if failed:
+                print(f"有 {len(failed)} 个文件未能替换，这些新文件保留在: {staging_dir}")
+            else:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            if stale:
+                print(f"有 {len(stale)} 个旧文件未能删除，请手动删除")
+            return stale + failed
+
+    os.rename(staging_dir, output_dir)
+    _remove_in_background([old_dir] if old_dir else [])
+    return []
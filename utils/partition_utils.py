@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+多维度划分工具模块
+除按班级划分外，预配置还可以声明按教师、校区、文理等（或多列组合）划分，
+在同一次提取中把每行同时分发到所有划分方式，各自输出到单独的子目录
+"""
+
+import re
+
+
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|]')
+
+
+def safe_file_name(name):
+    """
+    替换文件名中不允许出现的字符
+    :param name: 原始名称
+    :return: 可用作文件名或目录名的名称
+    """
+    name = _UNSAFE_CHARS.sub("_", str(name)).strip().strip(".")
+    return name or "_"
+
+
+def unique_file_names(keys):
+    """
+    为每个分组键生成互不相同的文件名（不含扩展名）
+    不同的键替换不安全字符后可能得到相同的名称（如 "A/B" 和 "A_B"），Windows下文件名还不区分大小写，
+    重名时依次加上 "(2)"、"(3)" 等后缀，后写出的文件不会覆盖先写出的文件
+    :param keys: 已排序的键列表，顺序相同时结果相同，续跑时文件名不变
+    :return: ({键: 文件名}, 加了后缀的键列表)
+    """
+    names = {}
+    renamed = []
+    used = set()
+    for key in keys:
+        base = safe_file_name(key)
+        name = base
+        count = 1
+        while name.casefold() in used:
+            count += 1
+            name = f"{base}({count})"
+        if count > 1:
+            renamed.append(key)
+        used.add(name.casefold())
+        names[key] = name
+    return names, renamed
+
+
+def normalize_partitions(partitions):
+    """
+    规范化划分配置
+    :param partitions: [{"name": "校区", "columns": [4]}, {"name": "校区_文理", "columns": [4, 8]}]
+    :return: [(划分名称, 列下标元组)]；没有配置时返回空列表
+    """
+    result = []
+    names = set()
+    for partition in partitions or ():
+        try:
+            name = safe_file_name(partition["name"])
+            columns = partition["columns"]
+            if isinstance(columns, int):
+                columns = [columns]
+            indexes = tuple(int(c) - 1 for c in columns)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"划分配置需要 name 和 columns: {partition}")
+        if not indexes or min(indexes) < 0:
+            raise ValueError(f"划分配置的列号必须从1开始: {partition}")
+        if name in names:
+            raise ValueError(f"划分名称重复: {name}")
+        names.add(name)
+        result.append((name, indexes))
+    return result
+
+
+def partition_key(row, indexes):
+    """
+    计算一行在某种划分方式下的键，多列组合时用下划线连接
+    :param row: 原始数据行
+    :param indexes: 列下标元组
+    :return: 键；所有列都为空时返回None
+    """
+    size = len(row)
+    values = [row[i] if i < size else None for i in indexes]
+    if all(v is None or v == "" for v in values):
+        return None
+    return "_".join("" if v is None else str(v) for v in values)
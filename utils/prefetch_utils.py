@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+预解析工具模块
+在用户回答设置对话框的同时，于后台线程中解析已选文件，按文件和sheet缓存原始行数据。
+工作目录位于网络共享或U盘等慢速存储时，少量读取线程先把整个文件顺序读入内存，
+解析线程只处理内存中的数据，读取和解析互相重叠；预读深度限制尚未解析的文件数量
+"""
+
+import io
+import os
+import queue
+import threading
+from threading import Lock
+from concurrent.futures import Future
+
+import psutil
+from openpyxl import load_workbook
+
+from utils.format_utils import probe_sheet_format
+from utils.extent_utils import DEFAULT_MAX_EMPTY_ROWS, trim_rows, trim_width
+
+
+# 预解析时采集样式的行数，表头行通常在前几行
+FORMAT_PROBE_ROWS = 20
+
+# 默认预读深度和并发读取数；慢速设备上并发读取过多反而会因为寻道变慢
+DEFAULT_READ_AHEAD = 4
+MAX_READERS = 2
+
+
+def read_sheet_rows(source, sheet_index, full_file_path=None, max_empty_rows=DEFAULT_MAX_EMPTY_ROWS,
+                    probe_rows=FORMAT_PROBE_ROWS):
+    """
+    读取整个sheet的原始行数据
+    :param source: Excel文件路径或已读入内存的文件对象
+    :param sheet_index: sheet序号（从0开始），也可以是多个sheet序号的元组
+    :param full_file_path: 可选，文件完整路径，用于错误信息
+    :param max_empty_rows: 连续空行达到该数量时停止读取，0表示不限制
+    :param probe_rows: 采集样式的行数，0表示不采集格式（不保留格式时）
+    :return: (行数据列表, 前几行的格式信息或None, 错误信息)，成功时错误信息为None；
+             sheet_index 为元组时返回与之对应的列表
+    """
+    indexes = sheet_index if isinstance(sheet_index, tuple) else (sheet_index,)
+    # 使用只读模式打开工作簿以提高性能
+    # data_only=True 确保所有公式都转换为静态值
+    # 多个sheet在同一次打开中读取，共享字符串只解析一次
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheets = wb.sheetnames
+        results = []
+        for index in indexes:
+            if index >= len(sheets):
+                results.append((None, None, f"文件 {os.path.basename(full_file_path or source)} 没有足够多的sheet"))
+                continue
+            ws = wb[sheets[index]]
+            # 只缓存实际数据范围内的行和列，因格式产生的空行空列不占用内存
+            rows = trim_width(list(trim_rows(ws.iter_rows(values_only=True), max_empty_rows)))
+            # 此时表头行号尚未确定，先采集前几行的样式，只采集到实际数据宽度
+            probe = None
+            if probe_rows:
+                probe = probe_sheet_format(wb, ws, probe_rows, max((len(row) for row in rows), default=0))
+            results.append((rows, probe, None))
+    finally:
+        wb.close()
+    return results if isinstance(sheet_index, tuple) else results[0]
+
+
+def file_stamp(full_file_path):
+    """
+    文件的大小和修改时间，用于判断缓存的解析结果是否过期
+    :param full_file_path: 文件完整路径
+    :return: (大小, 修改时间)；文件无法访问时返回None
+    """
+    try:
+        st = os.stat(full_file_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def read_file_bytes(full_file_path):
+    """
+    一次性顺序读取整个文件到内存
+    :param full_file_path: 文件完整路径
+    :return: 位于开头的 io.BytesIO
+    """
+    with open(full_file_path, 'rb') as f:
+        return io.BytesIO(f.read())
+
+
+class SheetCache:
+    """原始sheet行数据缓存，预读和解析任务由常驻的后台守护线程执行"""
+
+    def __init__(self, working_dir=".", max_workers=None, read_ahead=DEFAULT_READ_AHEAD,
+                 max_empty_rows=DEFAULT_MAX_EMPTY_ROWS, preserve_format=True):
+        """
+        :param working_dir: 工作目录
+        :param max_workers: 解析线程数，默认为CPU逻辑核心数
+        :param read_ahead: 预读深度，即最多有多少个已读入内存但尚未解析的文件；0表示不预读
+        :param max_empty_rows: 连续空行达到该数量时停止读取，0表示不限制
+        :param preserve_format: 是否采集格式；不保留格式时不读取样式
+        """
+        self.working_dir = working_dir
+        self.max_workers = max_workers or psutil.cpu_count(logical=True) or 1
+        self.read_ahead = max(0, int(read_ahead or 0))
+        self.max_empty_rows = max_empty_rows
+        self.preserve_format = preserve_format
+        # 表头行超出预解析采集范围时补充采集的格式：{(文件, sheet序号, 表头行): (格式信息, 文件标记)}
+        self._probes = {}
+        self._futures = {}
+        self._lock = Lock()
+        self._queue = queue.Queue()
+        self._read_queue = queue.Queue()
+        self._read_slots = threading.Semaphore(self.read_ahead)
+        self._threads = []
+
+    def _ensure_workers(self):
+        # 首次提交任务时才启动线程；守护线程不会阻止程序在对话框中途退出
+        if self._threads:
+            return
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"sheet-prefetch-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        for i in range(min(self.read_ahead, MAX_READERS)):
+            thread = threading.Thread(target=self._reader, name=f"sheet-read-ahead-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _reader(self):
+        while True:
+            item = self._read_queue.get()
+            if item is None:
+                return
+            read_future, full_file_path = item
+            if not read_future.set_running_or_notify_cancel():
+                continue
+            # 已读入内存的文件达到预读深度时等待解析线程消费
+            self._read_slots.acquire()
+            try:
+                read_future.set_result(read_file_bytes(full_file_path))
+            except OSError:
+                # 读取失败时交给解析线程按路径打开，由它报告错误
+                self._read_slots.release()
+                read_future.set_result(None)
+
+    def _release_slot(self, read_future):
+        # 只有成功读入内存的文件占用预读名额
+        if not read_future.cancelled() and read_future.result() is not None:
+            self._read_slots.release()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, read_future, full_file_path, sheet_index = item
+            if not future.set_running_or_notify_cancel():
+                if read_future is not None:
+                    read_future.cancel()
+                    read_future.add_done_callback(self._release_slot)
+                continue
+            try:
+                source = full_file_path
+                if read_future is not None:
+                    source = read_future.result() or full_file_path
+                future.set_result(read_sheet_rows(source, sheet_index, full_file_path, self.max_empty_rows,
+                                                  FORMAT_PROBE_ROWS if self.preserve_format else 0))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                if read_future is not None:
+                    self._release_slot(read_future)
+
+    def prefetch(self, files, sheet_index):
+        """
+        在后台开始解析文件的指定sheet，已在缓存中的文件不会重复解析
+        :param files: 文件名列表（相对于工作目录）
+        :param sheet_index: sheet序号，或同一次打开中读取的多个sheet序号的元组
+        """
+        for file in files:
+            self._submit(file, sheet_index)
+
+    def _submit(self, file, sheet_index):
+        key = (file, sheet_index)
+        full_file_path = os.path.join(self.working_dir, file)
+        # 同一会话中多次运行时，文件被修改过的缓存结果作废并重新解析
+        stamp = file_stamp(full_file_path)
+        with self._lock:
+            entry = self._futures.get(key)
+            future = entry[0] if entry is not None and entry[1] == stamp else None
+            if future is None:
+                self._ensure_workers()
+                future = Future()
+                self._futures[key] = (future, stamp)
+                read_future = None
+                if self.read_ahead:
+                    read_future = Future()
+                    self._read_queue.put((read_future, full_file_path))
+                self._queue.put((future, read_future, full_file_path, sheet_index))
+        return future
+
+    def get(self, file, sheet_index):
+        """
+        获取文件指定sheet的原始行数据，尚未解析完成时等待
+        :param file: 文件名
+        :param sheet_index: sheet序号，或与 prefetch 时相同的sheet序号元组
+        :return: (行数据列表, 格式信息, 错误信息)；sheet_index 为元组时返回与之对应的列表
+        """
+        return self._submit(file, sheet_index).result()
+
+    def sheet_probe(self, file, sheet_index, header_row, probe):
+        """
+        获取覆盖表头行和第一行数据的格式信息
+        预解析时表头行号尚未确定，只采集了前 FORMAT_PROBE_ROWS 行；表头行更靠后时重新打开文件补充采集
+        :param file: 文件名
+        :param sheet_index: sheet序号
+        :param header_row: 表头行号（从1开始）
+        :param probe: get 返回的格式信息
+        :return: 格式信息；不保留格式时为None
+        """
+        if probe is None or header_row < probe["max_row"]:
+            return probe
+        key = (file, sheet_index, header_row)
+        full_file_path = os.path.join(self.working_dir, file)
+        stamp = file_stamp(full_file_path)
+        with self._lock:
+            entry = self._probes.get(key)
+        if entry is not None and entry[1] == stamp:
+            return entry[0]
+        wb = load_workbook(full_file_path, read_only=True, data_only=True)
+        try:
+            deep_probe = probe_sheet_format(wb, wb.worksheets[sheet_index], header_row + 1, probe["max_col"])
+        finally:
+            wb.close()
+        with self._lock:
+            self._probes[key] = (deep_probe, stamp)
+        return deep_probe
+
+    def clear(self):
+        """丢弃所有缓存的行数据"""
+        with self._lock:
+            for future, _ in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+            self._probes.clear()
+
+    def close(self):
+        """丢弃缓存并停止所有后台线程"""
+        self.clear()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        # 每个线程取到一个None后退出，排在前面的已取消任务会先被丢弃
+        for _ in range(self.max_workers):
+            self._queue.put(None)
+        for _ in range(len(threads) - self.max_workers):
+            self._read_queue.put(None)
+
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+进度显示工具模块
+在同一行刷新显示进度条和处理速度
+"""
+
+import time
+
+
+class ProgressBar:
+    """单行刷新的进度条，显示完成数量和每秒处理行数"""
+
+    def __init__(self, total, label="提取进度", unit="文件", width=30):
+        self.total = total
+        self.label = label
+        self.unit = unit
+        self.width = width
+        self.done = 0
+        self.rows = 0
+        self.start_time = time.perf_counter()
+
+    def update(self, done=1, rows=0):
+        """
+        更新进度并刷新显示
+        :param done: 新完成的数量
+        :param rows: 新处理的数据行数
+        """
+        self.done += done
+        self.rows += rows
+        elapsed = max(time.perf_counter() - self.start_time, 1e-6)
+        filled = int(self.width * self.done / self.total) if self.total else self.width
+        bar = "#" * filled + "-" * (self.width - filled)
+        print(f"\r{self.label} [{bar}] {self.done}/{self.total} {self.unit} | "
+              f"{self.rows} 行 | {self.rows / elapsed:.0f} 行/秒 | {elapsed:.1f}秒",
+              end="", flush=True)
+
+
+def make_extraction_handler(total_files):
+    """
+    生成命令行使用的提取进度事件处理函数
+    :param total_files: 文件总数
+    :return: (事件处理函数, 从断点恢复的文件名列表)
+    """
+    progress = ProgressBar(total_files)
+    resumed = []
+
+    def on_event(event):
+        if event["type"] == "file_parsed":
+            progress.update(rows=event["rows"])
+            if event["cached"]:
+                resumed.append(event["file"])
+        elif event["type"] == "file_skipped":
+            print(f"\n{event['error']}，跳过该文件")
+            progress.update()
+        elif event["type"] == "sheet_skipped":
+            print(f"\n{event['error']}，跳过该sheet")
+
+    return on_event, resumed
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+排名工具模块
+所有文件合并后，对每个学科的成绩列在全年级范围内排序一次，同时得到班级排名和年级排名，
+并追加到每行末尾；生成总表时还可以按各学科成绩之和计算总分排名
+"""
+
+from utils.stats_utils import score_value
+
+
+RANK_METHODS = ("min", "dense", "ordinal")
+
+CLASS_RANK_TITLE = "班级排名"
+GRADE_RANK_TITLE = "年级排名"
+
+DEFAULT_RANKING = {
+    "column": None,
+    "method": "min",
+    "total": True,
+}
+
+
+def normalize_ranking_config(ranking):
+    """
+    规范化排名配置
+    :param ranking: 成绩列名，或包含 column、method、total 的字典
+    :return: 完整的配置字典；不需要排名时返回None
+    """
+    if not ranking:
+        return None
+    config = dict(DEFAULT_RANKING)
+    if isinstance(ranking, dict):
+        config.update({k: v for k, v in ranking.items() if k in DEFAULT_RANKING})
+    else:
+        config["column"] = ranking
+    if not config["column"]:
+        raise ValueError("排名配置需要指定成绩列名 column")
+    if config["method"] not in RANK_METHODS:
+        raise ValueError(f"排名方式应为 {' / '.join(RANK_METHODS)} 之一: {config['method']}")
+    return config
+
+
+class _Ranker:
+    """按分数从高到低依次给出名次"""
+
+    def __init__(self, method):
+        self.method = method
+        self.count = 0
+        self.last_score = None
+        self.last_rank = 0
+
+    def next(self, score):
+        self.count += 1
+        if self.method == "ordinal":
+            return self.count
+        if self.count > 1 and score == self.last_score:
+            return self.last_rank
+        # min: 并列占用名次（1, 2, 2, 4）；dense: 并列不占用名次（1, 2, 2, 3）
+        self.last_rank = self.count if self.method == "min" else self.last_rank + 1
+        self.last_score = score
+        return self.last_rank
+
+
+def rank_scores(entries, method="min"):
+    """
+    排序一次同时计算组内名次和总名次
+    :param entries: [(分数, 分组)] 列表，分数为None的条目不参与排名
+    :param method: 并列处理方式，见 RANK_METHODS
+    :return: 与 entries 对应的 [(组内名次, 总名次)]，不参与排名的条目为 (None, None)
+    """
+    ranks = [(None, None)] * len(entries)
+    # 稳定排序，ordinal 方式下分数相同的按原有顺序排名
+    order = sorted((i for i, entry in enumerate(entries) if entry[0] is not None),
+                   key=lambda i: -entries[i][0])
+    overall = _Ranker(method)
+    groups = {}
+    for i in order:
+        score, group = entries[i]
+        ranker = groups.get(group)
+        if ranker is None:
+            ranker = groups[group] = _Ranker(method)
+        ranks[i] = (ranker.next(score), overall.next(score))
+    return ranks
+
+
+def apply_subject_ranks(data, config):
+    """
+    为每个学科的数据行追加班级排名和年级排名两列，表头同时追加
+    没有成绩列的学科保持不变
+    :param data: 合并后的 SplitData
+    :param config: normalize_ranking_config 的结果
+    """
+    column = config["column"]
+    for subject, header in list(data.subject_headers.items()):
+        if column not in header:
+            continue
+        index = list(header).index(column)
+
+        entries = []
+        rows = []
+        for class_name, subjects in data.class_data.items():
+            for row in subjects.get(subject, ()):
+                entries.append((score_value(row[index]) if index < len(row) else None, class_name))
+                rows.append(row)
+        ranks = rank_scores(entries, config["method"])
+
+        # 同一行元组也被其他划分方式引用，按对象替换为带名次的新元组
+        ranked = {id(row): tuple(row) + rank for row, rank in zip(rows, ranks)}
+        for subjects in data.class_data.values():
+            if subject in subjects:
+                subjects[subject] = [ranked[id(row)] for row in subjects[subject]]
+        for keys in data.partition_data.values():
+            for subjects in keys.values():
+                if subject in subjects:
+                    subjects[subject] = [ranked.get(id(row), row) for row in subjects[subject]]
+        data.subject_headers[subject] = list(header) + [CLASS_RANK_TITLE, GRADE_RANK_TITLE]
+
+
+def compute_total_ranks(wide_table, config):
+    """
+    按学号汇总各学科的成绩列得到总分并排名，结果写入总表
+    :param wide_table: 已 build 的 WideTable
+    :param config: normalize_ranking_config 的结果
+    :return: {学号: (总分, 班级排名, 年级排名)}
+    """
+    column = config["column"]
+    positions = []
+    for subject in wide_table.subjects:
+        idx = wide_table.subject_indexes[subject]
+        if column in idx.value_names:
+            positions.append((idx.index, idx.value_names.index(column)))
+
+    students = []
+    entries = []
+    for class_name, student_ids in wide_table.class_students.items():
+        for student_id in student_ids:
+            total = None
+            for index, position in positions:
+                record = index.get(student_id)
+                score = score_value(record[2][position]) if record is not None else None
+                if score is not None:
+                    total = score if total is None else total + score
+            students.append(student_id)
+            entries.append((total, class_name))
+
+    ranks = rank_scores(entries, config["method"])
+    # 小数成绩相加会产生浮点误差，显示时保留两位小数
+    wide_table.total_ranks = {student_id: (None if entry[0] is None else round(entry[0], 2),) + rank
+                              for student_id, entry, rank in zip(students, entries, ranks)}
+    return wide_table.total_ranks
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+交互会话工具模块
+一次拆分完成后回到配置选择继续下一次拆分时，线程池、已解析的sheet缓存、
+sheet名称和表头行等元数据在会话内保持有效，后续运行只重做参数发生变化的阶段。
+所有缓存都以文件的大小和修改时间为依据，文件被修改后自动重新读取
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+from openpyxl import load_workbook
+
+from utils.prefetch_utils import SheetCache, file_stamp
+from utils.shard_utils import load_previous_run
+from utils.sheet_utils import list_all_sheets
+
+
+class Session:
+    """交互会话中跨多次拆分共享的线程池和缓存"""
+
+    def __init__(self, max_workers=None):
+        """
+        :param max_workers: 提取线程数，默认为CPU逻辑核心数
+        """
+        self.max_workers = max_workers or psutil.cpu_count(logical=True) or 1
+        self.runs = 0
+        self._executor = None
+        self._sheet_cache = None
+        self._sheet_cache_key = None
+        self._sheet_names = {}
+        self._header_rows = {}
+        self._previous_runs = {}
+
+    @property
+    def executor(self):
+        """会话内共享的提取线程池，首次使用时创建"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def sheet_cache(self, working_dir, read_ahead, max_empty_rows, preserve_format=True):
+        """
+        获取预解析缓存，工作目录和读取参数不变时沿用上次运行已解析的结果
+        :param working_dir: 工作目录
+        :param read_ahead: 预读深度
+        :param max_empty_rows: 连续空行上限
+        :param preserve_format: 是否采集格式
+        :return: SheetCache
+        """
+        key = (os.path.abspath(working_dir), read_ahead, max_empty_rows, preserve_format)
+        if key != self._sheet_cache_key:
+            if self._sheet_cache is not None:
+                self._sheet_cache.close()
+            self._sheet_cache = SheetCache(working_dir, read_ahead=read_ahead, max_empty_rows=max_empty_rows,
+                                           preserve_format=preserve_format)
+            self._sheet_cache_key = key
+        return self._sheet_cache
+
+    def list_sheets(self, full_file_path):
+        """
+        获取工作簿中的sheet名称，文件未修改时不再打开工作簿
+        :param full_file_path: 文件完整路径
+        :return: sheet名称列表
+        """
+        key = (os.path.abspath(full_file_path), file_stamp(full_file_path))
+        if key not in self._sheet_names:
+            self._sheet_names[key] = list_all_sheets(full_file_path)
+        return self._sheet_names[key]
+
+    def read_header_row(self, full_file_path, sheet_name, header_row):
+        """
+        读取表头行，文件未修改时直接使用上次读取的结果
+        :param full_file_path: 文件完整路径
+        :param sheet_name: sheet名称
+        :param header_row: 表头行号（从1开始）
+        :return: 表头行单元格值的元组
+        """
+        key = (os.path.abspath(full_file_path), file_stamp(full_file_path), sheet_name, header_row)
+        if key not in self._header_rows:
+            wb = load_workbook(full_file_path, read_only=True, data_only=True)
+            try:
+                ws = wb[sheet_name]
+                self._header_rows[key] = list(ws.iter_rows(min_row=header_row, max_row=header_row,
+                                                           values_only=True))[0]
+            finally:
+                wb.close()
+        return self._header_rows[key]
+
+    def load_previous_run(self, paths):
+        """
+        读取上次考试的中间文件，中间文件未修改时沿用已读取的数据
+        :param paths: 中间文件路径或路径列表
+        :return: 已 finalize 的 SplitData，只读使用
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        key = tuple((os.path.abspath(p), file_stamp(p)) for p in paths)
+        if key not in self._previous_runs:
+            self._previous_runs[key] = load_previous_run(paths)
+        return self._previous_runs[key]
+
+    def close(self):
+        """结束会话，停止后台线程并释放缓存"""
+        if self._sheet_cache is not None:
+            self._sheet_cache.close()
+            self._sheet_cache = None
+            self._sheet_cache_key = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._sheet_names.clear()
+        self._header_rows.clear()
+        self._previous_runs.clear()
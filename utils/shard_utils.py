@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+分片处理工具模块
+map 步骤在任意一部分文件上完成提取，把按班级划分好的结果保存为压缩的中间文件；
+merge 步骤合并任意多个中间文件并生成最终的班级文件。不同机器可以各自处理一个分片，最后在一台机器上合并。
+中间文件会在机器之间复制，因此只保存数据（gzip压缩的JSON），读取时不会执行任何代码，也不依赖类定义
+"""
+
+import io
+import os
+import gzip
+import json
+from datetime import date, datetime, time, timedelta
+
+from utils.split_utils import SplitData, extract_and_merge, save_class_files
+from utils.sqlite_utils import write_sqlite
+from utils.extent_utils import DEFAULT_MAX_EMPTY_ROWS
+from utils.compare_utils import Comparison, normalize_compare_config
+from utils.output_utils import prepare_staging, commit_staging, cleanup_old_generations
+from utils.progress_utils import make_extraction_handler
+
+
+# 中间文件第一行为 "标记 版本号"，在解析任何数据之前检查
+SHARD_MAGIC = b"SCORE-SPLIT-SHARD"
+SHARD_VERSION = 2
+
+
+def _encode_value(value):
+    # JSON 无法直接表示的单元格值（日期时间）编码为带类型标记的对象
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, time):
+        return {"$time": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"$timedelta": value.total_seconds()}
+    raise TypeError(f"无法保存到中间文件的值: {value!r}")
+
+
+_DECODERS = {
+    "$datetime": datetime.fromisoformat,
+    "$date": date.fromisoformat,
+    "$time": time.fromisoformat,
+    "$timedelta": lambda seconds: timedelta(seconds=seconds),
+}
+
+
+def _decode_object(obj):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        decoder = _DECODERS.get(key)
+        if decoder is not None:
+            return decoder(value)
+    return obj
+
+
+def select_shard(files, shard):
+    """
+    按 "K/N" 形式的分片编号从文件列表中选出第K份（共N份）
+    :param files: 文件名列表
+    :param shard: 分片编号，如 "1/3"
+    :return: 该分片的文件名列表
+    """
+    try:
+        k, n = (int(x) for x in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"分片编号格式应为 K/N，如 1/3: {shard}")
+    if not 1 <= k <= n:
+        raise ValueError(f"分片编号超出范围: {shard}")
+    return [f for i, f in enumerate(sorted(files)) if i % n == k - 1]
+
+
+def map_shard(selected_files, out_path, sheet_index, header_row, class_col, working_dir=".", student_id_col=None,
+              ignore_class_col=False, show_subject_header=True, row_filters=None, statistics=None,
+              wide_sheet=None, sheet_cache=None, partitions=None, preserve_format=True,
+              duplicate_policy=None, sqlite_output=None, ranking=None, max_empty_rows=DEFAULT_MAX_EMPTY_ROWS,
+              extra_sheets=None, compare=None):
+    """
+    提取一部分文件并保存为中间文件
+    参数含义与 split_and_save 相同
+    :param out_path: 中间文件路径
+    :return: 统计信息
+    """
+    params = {
+        "sheet_index": sheet_index,
+        "header_row": header_row,
+        "class_col": class_col,
+        "student_id_col": student_id_col,
+        "ignore_class_col": ignore_class_col,
+        "show_subject_header": show_subject_header,
+        "row_filters": row_filters,
+        "statistics": statistics,
+        "wide_sheet": wide_sheet,
+        "partitions": partitions,
+        "preserve_format": preserve_format,
+        "duplicate_policy": duplicate_policy,
+        "sqlite_output": sqlite_output,
+        "ranking": ranking,
+        "max_empty_rows": max_empty_rows,
+        "extra_sheets": extra_sheets,
+        "compare": compare,
+    }
+    print(f"开始处理 {len(selected_files)} 个文件...")
+    on_event, _ = make_extraction_handler(len(selected_files))
+    inputs = [(file, os.path.join(working_dir, file)) for file in selected_files]
+    # 依赖全年级数据的结果（年级基准、学号连接）留到合并时再计算
+    # 指定了学号列时保存每行的学号，以后可以作为上次考试的数据用于对比
+    data = extract_and_merge(inputs, sheet_index, header_row, class_col, student_id_col, ignore_class_col,
+                             row_filters, statistics, wide_sheet, sheet_cache, on_event=on_event,
+                             finalize=False, partitions=partitions, preserve_format=preserve_format,
+                             duplicate_policy=duplicate_policy, keep_student_ids=student_id_col is not None, ranking=ranking,
+                             max_empty_rows=max_empty_rows, extra_sheets=extra_sheets)
+
+    tmp_path = out_path + ".part"
+    with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+        f.write(b"%s %d\n" % (SHARD_MAGIC, SHARD_VERSION))
+        with io.TextIOWrapper(f, encoding="utf-8") as text:
+            json.dump({
+                "params": params,
+                "files": list(selected_files),
+                "data": data.to_data(),
+            }, text, ensure_ascii=False, separators=(",", ":"), default=_encode_value)
+    os.replace(tmp_path, out_path)
+    print(f"\n中间文件已保存: {out_path}")
+    return data.stats
+
+
+def load_shard(path):
+    """
+    读取中间文件
+    :param path: 中间文件路径
+    :return: 中间文件内容字典，其中 data 为尚未 finalize 的 SplitData
+    """
+    with gzip.open(path, 'rb') as f:
+        magic, _, version = f.readline(64).strip().partition(b" ")
+        if magic != SHARD_MAGIC:
+            raise ValueError(f"不是可识别的中间文件: {path}")
+        if version != str(SHARD_VERSION).encode():
+            raise ValueError(f"中间文件 {path} 的格式版本 {version.decode(errors='replace')} 与当前程序"
+                             f"（{SHARD_VERSION}）不一致，请重新生成")
+        shard = json.load(io.TextIOWrapper(f, encoding="utf-8"), object_hook=_decode_object)
+    try:
+        shard["data"] = SplitData.from_data(shard["data"])
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        raise ValueError(f"中间文件 {path} 内容不完整: {e}")
+    return shard
+
+
+def _load_and_merge(paths):
+    # 读取并合并多个中间文件，返回 (尚未 finalize 的数据, 参数)
+    data = None
+    params = None
+    seen_files = {}
+    for path in paths:
+        print(f"读取中间文件: {path}")
+        shard = load_shard(path)
+        if params is None:
+            params = shard["params"]
+        elif shard["params"] != params:
+            raise ValueError(f"中间文件 {path} 的参数与其他分片不一致，无法合并")
+        for file in shard["files"]:
+            if file in seen_files:
+                raise ValueError(f"文件 {file} 同时出现在 {seen_files[file]} 和 {path} 中")
+            seen_files[file] = path
+        if data is None:
+            data = shard["data"]
+        else:
+            data.merge(shard["data"])
+
+    if data is None:
+        raise ValueError("没有可合并的中间文件")
+    return data, params
+
+
+def load_previous_run(paths):
+    """
+    读取上次考试的中间文件，用于考试对比
+    :param paths: 中间文件路径或路径列表
+    :return: 已 finalize 的 SplitData
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    data, _ = _load_and_merge(paths)
+    # 在读取配置时就报告，而不是等到本次数据全部提取完成之后
+    if not data.student_ids:
+        raise ValueError("上次考试的中间文件中没有学号，请在指定学号列后重新生成")
+    data.finalize()
+    return data
+
+
+def merge_shards(paths, working_dir=".", existing_files_action="overwrite"):
+    """
+    合并多个中间文件并在工作目录下的"拆分"目录中生成班级文件
+    :param paths: 中间文件路径列表
+    :param working_dir: 工作目录
+    :param existing_files_action: 对"拆分"目录中现有文件的处理方式
+    :return: 统计信息
+    """
+    data, params = _load_and_merge(paths)
+    data.finalize()
+    compare = normalize_compare_config(params.get("compare"))
+    if compare:
+        data.comparison = Comparison(data, load_previous_run(compare["previous"]), compare)
+
+    output_dir = prepare_staging(working_dir)
+    cleanup_old_generations(working_dir)
+    print("\n数据合并完成，正在生成班级文件...")
+    save_class_files(data, output_dir, params["show_subject_header"])
+    if params.get("sqlite_output"):
+        write_sqlite(data, os.path.join(output_dir, params["sqlite_output"]))
+    data.stats["unreplaced_files"] = len(commit_staging(working_dir, keep_existing=existing_files_action == "overwrite"))
+    if not data.stats["unreplaced_files"]:
+        print("\n所有班级文件保存完成!")
+    return data.stats
@@ -1,77 +1,181 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import threading
 import psutil
 from datetime import datetime
 from openpyxl import load_workbook, Workbook
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
+from itertools import chain, islice
 
+from utils.checkpoint_utils import Checkpoint, make_signature, read_journal
+from utils.output_utils import get_staging_dir, prepare_staging, commit_staging, cleanup_old_generations
+from utils.progress_utils import ProgressBar, make_extraction_handler
+from utils.filter_utils import compile_row_filter
+from utils.stats_utils import StatsAccumulator, normalize_statistics_config
+from utils.join_utils import StudentIndex, WideTable, normalize_wide_sheet_config, normalize_student_id
+from utils.partition_utils import normalize_partitions, partition_key, unique_file_names
+from utils.format_utils import SheetFormat, probe_sheet_format
+from utils.duplicate_utils import DuplicateReport, filter_duplicates, normalize_duplicate_policy
+from utils.sqlite_utils import write_sqlite
+from utils.ranking_utils import normalize_ranking_config, apply_subject_ranks, compute_total_ranks
+from utils.extent_utils import DEFAULT_MAX_EMPTY_ROWS, trim_rows, data_width
+from utils.compare_utils import Comparison, normalize_compare_config
+from utils.multi_sheet_utils import SHEET_NAME_SEPARATOR, build_sheet_specs, normalize_extra_sheets, sheet_indexes
 
 
 def process_single_file(args):
     """处理单个文件的函数，用于多线程处理"""
-    (file, working_dir, sheet_index, header_row, class_col, 
-     student_id_col, ignore_class_col, subject) = args
+    (file, source, sheet_specs, ignore_class_col, subject, sheet_cache, stats_config,
+     wide_config, partitions, preserve_format, duplicate_policy, keep_student_ids, max_empty_rows) = args
     
-    full_file_path = os.path.join(working_dir, file)
+    def extract(rows, spec, sheet_probe):
+        # 每个sheet按各自的表头行、班级列、输出列和筛选条件提取，额外sheet的学科名带上后缀
+        # 其他划分方式的列号按主sheet的列计算，只用于主sheet
+        suffix, _, header_row, class_col, student_id_col, columns, row_filter = spec
+        result, error = extract_class_data(rows, file, class_col, student_id_col, ignore_class_col,
+                                           subject + suffix, row_filter, stats_config, wide_config,
+                                           None if suffix else partitions,
+                                           sheet_probe, duplicate_policy, keep_student_ids, columns)
+        return (subject + suffix, result), error
     
+    results = []
+    
+    # 已在后台预解析的文件直接使用缓存的原始行，这里只需投影列并按班级划分
+    if sheet_cache is not None:
+        if len(sheet_specs) == 1:
+            cached = [sheet_cache.get(file, sheet_specs[0][1])]
+        else:
+            cached = sheet_cache.get(file, sheet_indexes(sheet_specs))
+        for spec, (rows, probe, error) in zip(sheet_specs, cached):
+            if error:
+                # 预解析只会因为缺少sheet出错；缺少的是额外sheet时只跳过该sheet
+                if spec[0]:
+                    results.append((subject + spec[0], None))
+                    continue
+                return None, error
+            header_row = spec[2]
+            sheet_probe = None
+            if preserve_format:
+                probe = sheet_cache.sheet_probe(file, spec[1], header_row, probe)
+                sheet_probe = (probe, header_row) if probe is not None else None
+            item, error = extract(islice(rows, header_row - 1, None), spec, sheet_probe)
+            if error:
+                return None, error
+            results.append(item)
+        return results, None
+    
+    # source 可以是文件路径，也可以是内存中的文件对象
     # 使用只读模式打开工作簿以提高性能
     # data_only=True 确保所有公式都转换为静态值
-    wb = load_workbook(full_file_path, read_only=True, data_only=True)
-    
-    sheets = wb.sheetnames
-    if sheet_index >= len(sheets):
+    # 所有sheet在同一次打开中提取，共享字符串只解析一次
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheets = wb.sheetnames
+        for spec in sheet_specs:
+            sheet_index, header_row = spec[1], spec[2]
+            if sheet_index >= len(sheets):
+                # 缺少的是额外sheet（如赋分、小题分）时只跳过该sheet，主sheet照常提取
+                if spec[0]:
+                    results.append((subject + spec[0], None))
+                    continue
+                return None, f"文件 {file} 没有足够多的sheet"
+            ws = wb[sheets[sheet_index]]
+            
+            # 使用values_only=True以提高性能，确保获取的是静态值而不是公式
+            # 从表头行开始只遍历一次，表头和数据行共用同一个迭代器
+            # 连续空行达到上限即停止，不再遍历大量带格式的空行
+            rows = trim_rows(ws.iter_rows(min_row=header_row, values_only=True), max_empty_rows)
+            sheet_probe = None
+            if preserve_format:
+                # 格式只需读取表头行和第一行数据的样式以及列宽，只采集到表头和输出列的实际宽度
+                header = next(rows, None)
+                if header is not None:
+                    max_col = max(data_width(header), max(spec[5] or (0,)))
+                    sheet_probe = (probe_sheet_format(wb, ws, header_row + 1, max_col), header_row)
+                    rows = chain((header,), rows)
+            item, error = extract(rows, spec, sheet_probe)
+            if error:
+                return None, error
+            results.append(item)
+        return results, None
+    finally:
         wb.close()
-        return None, f"文件 {file} 没有足够多的sheet"
+
+
+def extract_class_data(rows, file, class_col, student_id_col, ignore_class_col, subject, row_filter=None, stats_config=None, wide_config=None, partitions=None, sheet_probe=None, duplicate_policy=None, keep_student_ids=False, columns=None):
+    """
+    从表头行开始的行迭代器中提取表头，并将数据行按班级划分
+    columns 为输出的源列号列表（从1开始），未指定时输出除学号列和忽略的班级列以外的全部列
+    """
+    # 提取表头
+    header_data = next(rows, None)
+    if header_data is None:
+        return None, f"文件 {file} 中找不到表头行"
     
-    ws = wb[sheets[sheet_index]]
+    # 表头最后一个非空单元格之后的列视为因格式产生的空列，表头和数据行都截断到这个宽度
+    width = max(data_width(header_data), class_col, student_id_col or 0, max(columns or (0,)),
+                max((max(indexes) + 1 for _, indexes in partitions), default=0) if partitions else 0)
+    if len(header_data) > width:
+        header_data = header_data[:width]
     
-    # 提取表头
-    header_data = list(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True))[0]
-    
-    # 处理表头（根据需要忽略学号列或班级列）
-    if student_id_col is not None or ignore_class_col:
-        modified_header = []
-        for i, cell in enumerate(header_data):
-            # 如果指定了学号列且当前列是学号列，则跳过
-            if student_id_col is not None and i + 1 == student_id_col:
-                continue
-            # 如果需要忽略班级列且当前列是班级列，则跳过
-            if ignore_class_col and i + 1 == class_col:
-                continue
-            modified_header.append(cell)
-        subject_header = modified_header
+    # 输出列对应的源列下标（根据需要忽略学号列或班级列）；不需要投影时为None
+    def dropped(i):
+        return ((student_id_col is not None and i + 1 == student_id_col)
+                or (ignore_class_col and i + 1 == class_col))
+    if columns:
+        kept_indexes = [c - 1 for c in columns if not dropped(c - 1)]
+    elif student_id_col is not None or ignore_class_col:
+        kept_indexes = [i for i in range(len(header_data)) if not dropped(i)]
+    else:
+        kept_indexes = None
+    
+    # 处理表头
+    if kept_indexes is not None:
+        size = len(header_data)
+        subject_header = [header_data[i] if i < size else None for i in kept_indexes]
     else:
         subject_header = header_data
+    
+    # 用输出列对应的源列把源sheet的列宽和样式映射到输出
+    sheet_format = None
+    if sheet_probe is not None:
+        format_indexes = kept_indexes if kept_indexes is not None else range(len(header_data))
+        sheet_format = SheetFormat(sheet_probe[0], sheet_probe[1], format_indexes) or None
 
     # 提取数据
     file_class_data = {}
     row_count = 0
     
-    # 使用values_only=True以提高性能，确保获取的是静态值而不是公式
-    for row in ws.iter_rows(min_row=header_row+1, values_only=True):
-        if not row or not row[class_col - 1]:
-            continue
-            
-        class_name = str(row[class_col - 1])
-        
-        # 如果指定了学号列或需要忽略班级列，则从数据行中移除相应列
-        if student_id_col is not None or ignore_class_col:
-            modified_row = []
-            for i, cell in enumerate(row):
-                # 如果指定了学号列且当前列是学号列，则跳过
-                if student_id_col is not None and i + 1 == student_id_col:
-                    continue
-                # 如果需要忽略班级列且当前列是班级列，则跳过
-                if ignore_class_col and i + 1 == class_col:
-                    continue
-                modified_row.append(cell)
-            row_data = tuple(modified_row)
-        else:
-            row_data = row
-            
+    # 其他划分方式：{划分名称: {键: {学科: 行列表}}}，与班级数据共用同一个行元组
+    file_partitions = {name: {} for name, _ in partitions} if partitions else None
+    
+    # 统计累加器与提取在同一次遍历中完成，不需要再读一遍数据
+    file_stats = StatsAccumulator(**stats_config) if stats_config else None
+    stat_columns = file_stats.select_columns(subject_header) if file_stats else None
+    
+    # 总表所需的学号索引同样在这次遍历中建立，只保存选定的列
+    student_index = None
+    if wide_config and student_id_col is not None:
+        student_index = StudentIndex(header_data, student_id_col, class_col,
+                                     wide_config["columns"], wide_config["info_columns"])
+    
+    records = _iter_records(rows, class_col, kept_indexes, row_filter, width)
+    
+    # 需要处理重复记录时先经过哈希索引过滤，保留的记录顺序不变
+    duplicates = None
+    if duplicate_policy is not None:
+        filtered, error = filter_duplicates(records, subject, duplicate_policy, student_id_col)
+        if error:
+            return None, f"文件 {file}: {error}"
+        records, duplicates = filtered
+    
+    # 输出行中不含学号列，需要时按行顺序另存学号：{班级: {学科: 学号列表}}
+    file_student_ids = {} if keep_student_ids and student_id_col is not None else None
+    
+    for class_name, row, row_data in records:
         # 将数据添加到对应班级
         if class_name not in file_class_data:
             file_class_data[class_name] = {}
@@ -79,130 +183,601 @@ def process_single_file(args):
             file_class_data[class_name][subject] = []
             
         file_class_data[class_name][subject].append(row_data)
+        if file_student_ids is not None:
+            student_id = normalize_student_id(row[student_id_col - 1]) if student_id_col <= len(row) else None
+            file_student_ids.setdefault(class_name, {}).setdefault(subject, []).append(student_id)
+        if file_stats is not None:
+            file_stats.add((class_name, subject), row_data, stat_columns)
+        if student_index is not None:
+            student_index.add(class_name, row)
+        if file_partitions is not None:
+            for name, indexes in partitions:
+                key = partition_key(row, indexes)
+                if key is not None:
+                    file_partitions[name].setdefault(key, {}).setdefault(subject, []).append(row_data)
         row_count += 1
     
-    wb.close()
-    
-    return (file_class_data, subject_header, row_count), None
+    return (file_class_data, subject_header, row_count, file_stats, student_index, file_partitions,
+            sheet_format, duplicates, file_student_ids), None
 
 
-def split_and_save(selected_files, sheet_index, sheet_name, header_row, class_col, working_dir=".", student_id_col=None, ignore_class_col=False, show_subject_header=True):
-    output_dir = os.path.join(working_dir, "拆分")
-    os.makedirs(output_dir, exist_ok=True)
+def _iter_records(rows, class_col, kept_indexes, row_filter, width):
+    # 逐行产生 (班级, 原始行, 输出行)，跳过没有班级和不满足筛选条件的行
+    for row in rows:
+        if len(row) < class_col or not row[class_col - 1]:
+            continue
+        
+        # 不满足筛选条件的行在复制和存储之前就被丢弃
+        # 在截断之前判断，筛选条件可以引用表头范围之外的列
+        if row_filter is not None and not row_filter(row):
+            continue
+        
+        # 去掉表头范围之外的空单元格后再保存
+        if len(row) > width:
+            row = row[:width]
+            
+        class_name = str(row[class_col - 1])
+        
+        # 只保留输出列（去掉学号列、忽略的班级列或未选择的列）
+        if kept_indexes is not None:
+            size = len(row)
+            row_data = tuple(row[i] for i in kept_indexes if i < size)
+        else:
+            row_data = row
+        yield class_name, row, row_data
+
 
-    class_data = {}
-    subject_headers = {}
+def order_subjects(subjects):
+    """按照指定顺序排列学科，其他学科保持原有顺序排在后面"""
+    subject_order = ["语文", "数学", "外语", "物理", "化学", "生物", "历史", "地理", "政治"]
     
-    stats = {
-        "processed_files": 0,
-        "total_files": len(selected_files),
-        "generated_classes": 0,
-        "total_rows": 0,
-        "skipped_files": 0
-    }
+    def position(subject):
+        # 额外sheet（如"数学-赋分"）紧跟在对应学科之后
+        base = subject.split(SHEET_NAME_SEPARATOR, 1)[0]
+        if base in subject_order:
+            return subject_order.index(base), subject != base
+        return len(subject_order), False
     
-    # 使用线程锁保护共享数据
-    class_data_lock = Lock()
+    # 稳定排序，其他学科保持原有顺序排在后面
+    return sorted(subjects, key=position)
+
+
+class SplitData:
+    """一次提取合并后的全部数据，供写出班级文件或其他输出目标使用"""
+
+    def __init__(self, total_files, stats_config=None, wide_config=None, duplicate_policy=None,
+                 ranking_config=None):
+        self.class_data = {}
+        self.subject_headers = {}
+        # 每个学科从源sheet采集的格式
+        self.subject_formats = {}
+        self.class_stats = StatsAccumulator(**stats_config) if stats_config else None
+        self.grade_stats = None
+        self.wide_table = WideTable() if wide_config else None
+        # 班级以外的划分方式：{划分名称: {键: {学科: 行列表}}}
+        self.partition_data = {}
+        self.duplicate_policy = duplicate_policy
+        self.duplicates = DuplicateReport() if duplicate_policy else None
+        # 与 class_data 中各行一一对应的学号，只在需要时保存
+        self.student_ids = {}
+        self.ranking_config = ranking_config
+        # 可选的考试对比结果，见 compare_utils.Comparison
+        self.comparison = None
+        self.stats = {
+            "processed_files": 0,
+            "total_files": total_files,
+            "generated_classes": 0,
+            "total_rows": 0,
+            "skipped_files": 0,
+            "resumed_files": 0,
+            "resumed_classes": 0,
+            "partition_files": 0,
+            "duplicate_rows": 0,
+            "unreplaced_files": 0
+        }
+        # 使用线程锁保护共享数据
+        self._lock = Lock()
+
+    def to_data(self):
+        """
+        把尚未 finalize 的数据转换为只包含基本类型的字典，用于保存分片中间文件
+        格式不依赖类定义，读取时不会执行任何代码；单元格中的日期时间由保存方编码
+        :return: 字典
+        """
+        # 其他划分方式与班级数据共用同一个行元组，只保存其在班级数据中的位置
+        positions = {}
+        for class_name, subjects in self.class_data.items():
+            for rows in subjects.values():
+                for i, row in enumerate(rows):
+                    positions[id(row)] = [class_name, i]
+        partition_data = {
+            name: {key: {subject: [positions[id(row)] for row in rows] for subject, rows in subjects.items()}
+                   for key, subjects in keys.items()}
+            for name, keys in self.partition_data.items()
+        }
+        wide_table = None
+        if self.wide_table is not None:
+            wide_table = {subject: student_index.to_data()
+                          for subject, student_index in self.wide_table.subject_indexes.items()}
+        return {
+            "class_data": self.class_data,
+            "subject_headers": self.subject_headers,
+            "subject_formats": {subject: sheet_format.to_data()
+                                for subject, sheet_format in self.subject_formats.items()},
+            "class_stats": self.class_stats.to_data() if self.class_stats is not None else None,
+            "wide_table": wide_table,
+            "partition_data": partition_data,
+            "duplicate_policy": self.duplicate_policy,
+            "duplicates": self.duplicates.to_data() if self.duplicates is not None else None,
+            "student_ids": self.student_ids,
+            "ranking_config": self.ranking_config,
+            "stats": self.stats,
+        }
+
+    @classmethod
+    def from_data(cls, state):
+        """
+        从 to_data 的结果恢复
+        :param state: to_data 的结果
+        :return: 尚未 finalize 的 SplitData
+        """
+        data = cls(state["stats"]["total_files"], duplicate_policy=state["duplicate_policy"],
+                   ranking_config=state["ranking_config"])
+        data.class_data = {class_name: {subject: [tuple(row) for row in rows] for subject, rows in subjects.items()}
+                           for class_name, subjects in state["class_data"].items()}
+        data.subject_headers = state["subject_headers"]
+        data.subject_formats = {subject: SheetFormat.from_data(sheet_format)
+                                for subject, sheet_format in state["subject_formats"].items()}
+        if state["class_stats"] is not None:
+            data.class_stats = StatsAccumulator.from_data(state["class_stats"])
+        if state["wide_table"] is not None:
+            data.wide_table = WideTable()
+            for subject, student_index in state["wide_table"].items():
+                data.wide_table.add(subject, StudentIndex.from_data(student_index))
+        class_data = data.class_data
+        data.partition_data = {
+            name: {key: {subject: [class_data[class_name][subject][i] for class_name, i in positions]
+                         for subject, positions in subjects.items()}
+                   for key, subjects in keys.items()}
+            for name, keys in state["partition_data"].items()
+        }
+        if state["duplicates"] is not None:
+            data.duplicates = DuplicateReport.from_data(state["duplicates"])
+        data.student_ids = state["student_ids"]
+        data.stats.update(state["stats"])
+        return data
+
+    def merge_file(self, results):
+        """
+        合并单个文件的提取结果
+        :param results: process_single_file 的结果，即 [(学科名, 单个sheet的提取结果)]，
+                        文件中缺少的额外sheet提取结果为None
+        :return: 该文件的数据行数
+        """
+        row_count = sum(self.merge_result(file_subject, result) for file_subject, result in results
+                        if result is not None)
+        with self._lock:
+            self.stats["processed_files"] += 1
+        return row_count
+
+    def merge_result(self, file_subject, result):
+        """
+        合并单个sheet的提取结果
+        :param file_subject: sheet对应的学科名（额外sheet带有后缀）
+        :param result: extract_class_data 的结果
+        :return: 该sheet的数据行数
+        """
+        (file_class_data, subject_header, row_count, file_stats, student_index, file_partitions,
+         sheet_format, duplicates, file_student_ids) = result
+        class_data = self.class_data
+        
+        # 线程安全地更新共享数据
+        with self._lock:
+            # 合并班级数据
+            for class_name, subjects in file_class_data.items():
+                if class_name not in class_data:
+                    class_data[class_name] = {}
+                for subject, rows in subjects.items():
+                    if subject not in class_data[class_name]:
+                        class_data[class_name][subject] = []
+                    class_data[class_name][subject].extend(rows)
+            if file_partitions:
+                self._merge_partitions(file_partitions)
+            if file_student_ids:
+                self._merge_groups(self.student_ids, file_student_ids)
+            
+            # 保存表头（假设所有同名学科的表头相同）
+            self.subject_headers[file_subject] = subject_header
+            if sheet_format is not None:
+                self.subject_formats[file_subject] = sheet_format
+            
+            if self.class_stats is not None and file_stats is not None:
+                self.class_stats.merge(file_stats)
+            if self.wide_table is not None and student_index is not None:
+                self.wide_table.add(file_subject, student_index)
+            if self.duplicates is not None and duplicates is not None:
+                self.duplicates.merge(duplicates)
+                self.stats["duplicate_rows"] += duplicates.dropped
+            
+            self.stats["total_rows"] += row_count
+        return row_count
+
+    @staticmethod
+    def _merge_groups(target_groups, groups):
+        # {分组: {学科: 列表}} 结构按学科追加
+        for key, subjects in groups.items():
+            target = target_groups.setdefault(key, {})
+            for subject, rows in subjects.items():
+                target.setdefault(subject, []).extend(rows)
+
+    def _merge_partitions(self, partitions):
+        for name, keys in partitions.items():
+            self._merge_groups(self.partition_data.setdefault(name, {}), keys)
+
+    def merge(self, other):
+        """
+        合并另一份 SplitData（如其他机器上处理的分片），两者需使用相同的参数
+        :param other: 尚未 finalize 的 SplitData
+        """
+        with self._lock:
+            self._merge_groups(self.class_data, other.class_data)
+            self._merge_groups(self.student_ids, other.student_ids)
+            self._merge_partitions(other.partition_data)
+            self.subject_headers.update(other.subject_headers)
+            self.subject_formats.update(other.subject_formats)
+            if self.class_stats is not None and other.class_stats is not None:
+                self.class_stats.merge(other.class_stats)
+            if self.wide_table is not None and other.wide_table is not None:
+                for subject, student_index in other.wide_table.subject_indexes.items():
+                    self.wide_table.add(subject, student_index)
+            if self.duplicates is not None and other.duplicates is not None:
+                self.duplicates.merge(other.duplicates)
+            for key in ("processed_files", "total_files", "total_rows", "skipped_files", "duplicate_rows"):
+                self.stats[key] += other.stats[key]
+
+    def finalize(self):
+        """所有文件合并完成后计算依赖全年级数据的结果"""
+        self.stats["generated_classes"] = len(self.class_data)
+        
+        # 年级基准由各班统计合并得到
+        if self.class_stats is not None:
+            self.grade_stats = self.class_stats.grade_totals()
+        
+        # 按学号连接各学科，确定每个学生所属班级并统计缺失和重复
+        if self.wide_table is not None:
+            self.wide_table.build(order_subjects(list(self.subject_headers)))
+        
+        # 排名需要全年级的数据，在所有文件合并后按学科各排序一次
+        if self.ranking_config is not None:
+            apply_subject_ranks(self, self.ranking_config)
+            if self.wide_table is not None and self.ranking_config["total"]:
+                compute_total_ranks(self.wide_table, self.ranking_config)
+
+    def sorted_classes(self):
+        """按班级排序"""
+        return sorted(self.class_data.keys(), key=lambda x: int(x) if x.isdigit() else x)
+
+    def sorted_partition_keys(self, name):
+        """按键排序某种划分方式下的所有分组"""
+        return sorted(self.partition_data.get(name, {}))
+
+
+def _run_task(task):
+    # 在工作线程中计时，便于通过事件报告每个文件的耗时
+    start = time.perf_counter()
+    result, error = process_single_file(task)
+    return result, error, time.perf_counter() - start
+
+
+def extract_and_merge(inputs, sheet_index, header_row, class_col, student_id_col=None, ignore_class_col=False,
+                      row_filters=None, statistics=None, wide_sheet=None, sheet_cache=None, checkpoint=None,
+                      on_event=None, max_workers=None, finalize=True, partitions=None, preserve_format=True,
+                      duplicate_policy=None, keep_student_ids=False, ranking=None,
+                      max_empty_rows=DEFAULT_MAX_EMPTY_ROWS, extra_sheets=None, executor=None):
+    """
+    并行提取所有输入文件并合并为按班级划分的数据
+    :param inputs: [(文件名, 文件路径或文件对象)] 列表，学科名取自文件名
+    :param sheet_cache: 可选，后台预解析的 SheetCache（按文件名查找）
+    :param checkpoint: 可选，断点日志，只对文件路径输入有效
+    :param on_event: 可选，进度事件回调，参数为事件字典
+    :param finalize: 是否计算依赖全年级数据的结果；生成分片中间结果时为False
+    :param partitions: 可选，班级以外的划分方式配置，见 normalize_partitions
+    :param preserve_format: 是否保留源sheet的列宽、数字格式和表头样式
+    :param duplicate_policy: 可选，学科内重复记录的处理策略，见 DUPLICATE_POLICIES
+    :param keep_student_ids: 是否另存每行的学号（输出行中不含学号列），供数据库输出使用
+    :param ranking: 可选，排名配置，见 normalize_ranking_config
+    :param max_empty_rows: 连续空行达到该数量时认为数据已经结束，0表示不限制
+    :param extra_sheets: 可选，同一文件中需要额外提取的sheet，见 normalize_extra_sheets
+    :param executor: 可选，复用的线程池（如交互会话中常驻的线程池），未指定时临时创建
+    :return: SplitData
+    """
+    emit = on_event or (lambda event: None)
+    start_time = time.perf_counter()
+
+    def emit_missing_sheets(file, results):
+        for file_subject, result in results:
+            if result is None:
+                emit({"type": "sheet_skipped", "file": file, "sheet": file_subject,
+                      "error": f"文件 {file} 中没有 {file_subject} 对应的sheet",
+                      "elapsed": time.perf_counter() - start_time})
+
+    # 筛选条件只编译一次，由所有工作线程共享
+    row_filter = compile_row_filter(row_filters)
     
-    total_files = len(selected_files)
-    print(f"开始处理 {total_files} 个文件...")
+    # 排名在 finalize 时对合并后的数据计算
+    ranking_config = normalize_ranking_config(ranking)
+
+    # 各班各学科的统计数据，在合并提取结果时汇总；未指定统计列时统计排名所用的成绩列
+    stats_config = normalize_statistics_config(statistics, ranking_config["column"] if ranking_config else None)
+    
+    # 按学号连接各学科生成总表，需要指定学号列
+    wide_config = normalize_wide_sheet_config(wide_sheet) if student_id_col is not None else None
+
+    # 其他划分方式在同一次遍历中一起完成
+    partition_config = normalize_partitions(partitions)
+
+    # 重复记录在每个文件提取时检测
+    duplicate_policy = normalize_duplicate_policy(duplicate_policy)
+
+    # 主sheet和额外sheet在同一次打开工作簿时提取，每个sheet使用各自的筛选条件
+    sheet_specs = build_sheet_specs(sheet_index, header_row, class_col, student_id_col,
+                                    normalize_extra_sheets(extra_sheets), row_filter)
+
+    data = SplitData(len(inputs), stats_config, wide_config, duplicate_policy, ranking_config)
+    stats = data.stats
+    merge_file = data.merge_file
     
     # 使用线程池处理文件以提高性能
     # 使用所有逻辑核心来处理文件，提高处理速度
-    max_workers = psutil.cpu_count(logical=True) or 1
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 准备任务参数
+    max_workers = max_workers or psutil.cpu_count(logical=True) or 1
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+        # 准备任务参数，已在断点中缓存的文件直接使用缓存结果
         tasks = []
-        for file in selected_files:
+        for file, source in inputs:
             subject = os.path.splitext(file)[0]
+            cached = checkpoint.load_extraction(file, source) if checkpoint is not None else None
+            if cached is not None:
+                row_count = merge_file(cached)
+                emit_missing_sheets(file, cached)
+                stats["resumed_files"] += 1
+                emit({"type": "file_parsed", "file": file, "subject": subject, "rows": row_count,
+                      "seconds": 0.0, "cached": True, "elapsed": time.perf_counter() - start_time})
+                continue
             tasks.append((
-                file, working_dir, sheet_index, header_row, class_col,
-                student_id_col, ignore_class_col, subject
+                file, source, sheet_specs, ignore_class_col, subject, sheet_cache, stats_config,
+                wide_config, partition_config, preserve_format, duplicate_policy, keep_student_ids,
+                max_empty_rows
             ))
         
         # 提交所有任务
-        future_to_file = {executor.submit(process_single_file, task): task[0] for task in tasks}
+        future_to_task = {executor.submit(_run_task, task): task for task in tasks}
         
         # 处理完成的任务
-        for future in as_completed(future_to_file):
-            file = future_to_file[future]
+        for future in as_completed(future_to_task):
+            task = future_to_task[future]
+            file, source, subject = task[0], task[1], task[4]
             try:
-                result, error = future.result()
+                result, error, seconds = future.result()
                 if error:
-                    print(f"\n{error}，跳过该文件")
                     stats["skipped_files"] += 1
+                    emit({"type": "file_skipped", "file": file, "error": error,
+                          "elapsed": time.perf_counter() - start_time})
                 else:
-                    file_class_data, subject_header, row_count = result
-                    
-                    # 线程安全地更新共享数据
-                    with class_data_lock:
-                        # 合并班级数据
-                        for class_name, subjects in file_class_data.items():
-                            if class_name not in class_data:
-                                class_data[class_name] = {}
-                            for subject, rows in subjects.items():
-                                if subject not in class_data[class_name]:
-                                    class_data[class_name][subject] = []
-                                class_data[class_name][subject].extend(rows)
-                        
-                        # 保存表头（假设所有同名学科的表头相同）
-                        subject_headers[subject] = subject_header
-                        
-                        stats["processed_files"] += 1
-                        stats["total_rows"] += row_count
+                    row_count = merge_file(result)
+                    emit_missing_sheets(file, result)
+                    if checkpoint is not None:
+                        checkpoint.save_extraction(file, source, result)
+                    emit({"type": "file_parsed", "file": file, "subject": subject, "rows": row_count,
+                          "seconds": seconds, "cached": False, "elapsed": time.perf_counter() - start_time})
                         
             except Exception as e:
-                print(f"\n处理文件 {file} 时出错: {e}，跳过该文件")
                 stats["skipped_files"] += 1
+                emit({"type": "file_skipped", "file": file, "error": f"处理文件 {file} 时出错: {e}",
+                      "elapsed": time.perf_counter() - start_time})
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    if finalize:
+        data.finalize()
     
-    print("\n数据提取完成，正在生成班级文件...")
+    emit({"type": "extraction_done", "files": stats["processed_files"], "rows": stats["total_rows"],
+          "classes": len(data.class_data), "elapsed": time.perf_counter() - start_time})
+    return data
 
-    # 按班级排序
-    sorted_classes = sorted(class_data.keys(), key=lambda x: int(x) if x.isdigit() else x)
-    stats["generated_classes"] = len(sorted_classes)
+
+def build_class_workbook(data, cls, show_subject_header=True, current_date=None, partition=None):
+    """
+    生成单个班级的工作簿（尚未保存）
+    :param data: extract_and_merge 返回的 SplitData
+    :param cls: 班级名；指定 partition 时为该划分方式下的分组键
+    :param current_date: 标题行中的制表日期，默认为今天
+    :param partition: 可选，班级以外的划分方式名称，此时只写出各学科sheet
+    :return: 工作簿；班级没有任何数据时返回None
+    """
+    if partition is None:
+        subjects = data.class_data[cls]
+    else:
+        subjects = data.partition_data[partition][cls]
+    subject_headers = data.subject_headers
+    if current_date is None:
+        current_date = datetime.now().strftime("%Y-%m-%d")
+    
+    # 使用write_only模式提高写入性能
+    out_wb = Workbook(write_only=True)
+    
+    # 按照指定顺序创建sheet
+    ordered_subjects = order_subjects(subjects)
+    
+    # 总表放在最前面
+    if partition is None and data.wide_table is not None:
+        data.wide_table.write_sheet(out_wb, cls)
+    if partition is None and data.comparison is not None:
+        data.comparison.write_sheet(out_wb, cls, ordered_subjects)
+    
+    # 创建sheet并写入数据
+    for subject in ordered_subjects:
+        if subject in subjects:  # 确保学科存在
+            rows = subjects[subject]
+            ws = out_wb.create_sheet(title=subject)
+            sheet_format = data.subject_formats.get(subject)
+            # 列宽必须在写入第一行之前设置
+            if sheet_format is not None:
+                sheet_format.apply_widths(ws)
+            # 根据show_subject_header参数决定是否添加标题行
+            if show_subject_header:
+                # 添加标题行，分别放在四个单元格中
+                title_row = [f"{subject}", f"{current_date}"]
+                # 根据表头长度调整标题行的长度
+                if subject in subject_headers and len(subject_headers[subject]) > len(title_row):
+                    title_row.extend([""] * (len(subject_headers[subject]) - len(title_row)))
+                ws.append(title_row)
+            # 使用每个学科自己的表头
+            if subject in subject_headers:
+                header = subject_headers[subject]
+                ws.append(sheet_format.header_cells(ws, header) if sheet_format is not None else header)
+            styled = sheet_format.row_styler(ws) if sheet_format is not None else None
+            if styled is None:
+                for row in rows:
+                    # 直接写入元组数据，避免转换为列表的开销
+                    ws.append(row)
+            else:
+                for row in rows:
+                    ws.append(styled(row))
+    
+    # 追加统计sheet
+    if partition is None and data.class_stats is not None:
+        data.class_stats.write_summary_sheet(out_wb, cls, ordered_subjects, subject_headers, data.grade_stats)
+    
+    # 只有当工作簿有工作表时才保存
+    if not out_wb.worksheets:
+        return None
+    return out_wb
+
+
+def save_class_files(data, output_dir, show_subject_header=True, checkpoint=None):
+    """
+    将合并后的数据写出为每班一个xlsx文件，其他划分方式写入以划分名称命名的子目录
+    :param data: 已 finalize 的 SplitData
+    :param output_dir: 输出目录（通常是暂存目录）
+    :param checkpoint: 可选，断点日志，已完整写出的班级文件会被跳过
+    """
+    stats = data.stats
+    if data.wide_table is not None:
+        data.wide_table.print_report()
+    if data.duplicates is not None:
+        data.duplicates.print_report(data.duplicate_policy)
+    if data.comparison is not None:
+        data.comparison.print_report()
+
+    sorted_classes = data.sorted_classes()
     
     # 获取当前日期用于制表日期
     current_date = datetime.now().strftime("%Y-%m-%d")
     
+    # 所有要写出的文件：(断点中的键, 输出路径, 班级或分组键, 划分名称)
+    jobs = [(cls, os.path.join(output_dir, f"{cls}.xlsx"), cls, None) for cls in sorted_classes]
+    for name in data.partition_data:
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+        keys = data.sorted_partition_keys(name)
+        file_names, renamed = unique_file_names(keys)
+        if renamed:
+            print(f"\n划分 {name} 中有 {len(renamed)} 个分组的文件名与其他分组相同，已在文件名后加上序号: "
+                  f"{', '.join(str(key) for key in renamed[:5])}")
+        for key in keys:
+            jobs.append((f"{name}/{key}", os.path.join(output_dir, name, f"{file_names[key]}.xlsx"), key, name))
+    
     # 保存每个班的文件
-    total_classes = len(sorted_classes)
-    for idx, cls in enumerate(sorted_classes, 1):
-        
-        subjects = class_data[cls]
-        out_file = os.path.join(output_dir, f"{cls}.xlsx")
-        # 使用write_only模式提高写入性能
-        out_wb = Workbook(write_only=True)
-        
-        # 按照指定顺序创建sheet
-        subject_order = ["语文", "数学", "外语", "物理", "化学", "生物", "历史", "地理", "政治"]
-        ordered_subjects = [subject for subject in subject_order if subject in subjects]
-        # 添加其他学科
-        ordered_subjects.extend([subject for subject in subjects if subject not in ordered_subjects])
+    write_progress = ProgressBar(len(jobs), label="写入进度", unit="文件")
+    for job_key, out_file, cls, partition in jobs:
+        groups = data.class_data if partition is None else data.partition_data[partition]
+        class_rows = sum(len(rows) for rows in groups[cls].values())
+        # 断点中已完整写出的班级文件直接跳过，不完整的文件会被重写
+        if checkpoint is not None and checkpoint.is_written(job_key, out_file):
+            stats["resumed_classes"] += 1
+            write_progress.update()
+            continue
         
-        # 创建sheet并写入数据
-        for subject in ordered_subjects:
-            if subject in subjects:  # 确保学科存在
-                rows = subjects[subject]
-                ws = out_wb.create_sheet(title=subject)
-                # 根据show_subject_header参数决定是否添加标题行
-                if show_subject_header:
-                    # 添加标题行，分别放在四个单元格中
-                    title_row = [f"{subject}", f"{current_date}"]
-                    # 根据表头长度调整标题行的长度
-                    if subject in subject_headers and len(subject_headers[subject]) > len(title_row):
-                        title_row.extend([""] * (len(subject_headers[subject]) - len(title_row)))
-                    ws.append(title_row)
-                # 使用每个学科自己的表头
-                if subject in subject_headers:
-                    ws.append(subject_headers[subject])
-                for row in rows:
-                    # 直接写入元组数据，避免转换为列表的开销
-                    ws.append(row)
+        out_wb = build_class_workbook(data, cls, show_subject_header, current_date, partition)
         
-        # 只有当工作簿有工作表时才保存
-        if out_wb.worksheets:
-            out_wb.save(out_file)
+        # 先写入临时文件再替换，中断时不会留下看似完整的半截文件
+        if out_wb is not None:
+            part_file = out_file + ".part"
+            out_wb.save(part_file)
+            os.replace(part_file, out_file)
+            if checkpoint is not None:
+                checkpoint.mark_written(job_key, out_file)
+            if partition is not None:
+                stats["partition_files"] += 1
+        write_progress.update(rows=class_rows)
+    
+    if stats["resumed_classes"]:
+        print(f"\n从断点跳过了 {stats['resumed_classes']} 个已完成的班级文件")
+
+
+def split_and_save(selected_files, sheet_index, sheet_name, header_row, class_col, working_dir=".", student_id_col=None, ignore_class_col=False, show_subject_header=True, resume=False, existing_files_action="overwrite", sheet_cache=None, row_filters=None, statistics=None, wide_sheet=None, partitions=None, preserve_format=True, duplicate_policy=None, sqlite_output=None, ranking=None, max_empty_rows=DEFAULT_MAX_EMPTY_ROWS, extra_sheets=None, compare=None, previous=None, executor=None):
+    # 断点日志：记录已完成的提取结果和班级文件，resume=True 时跳过已完成的工作
+    signature = make_signature({
+        "files": sorted(selected_files),
+        "sheet_index": sheet_index,
+        "header_row": header_row,
+        "class_col": class_col,
+        "student_id_col": student_id_col,
+        "ignore_class_col": ignore_class_col,
+        "show_subject_header": show_subject_header,
+        "row_filters": row_filters,
+        "statistics": statistics,
+        "wide_sheet": wide_sheet,
+        "partitions": partitions,
+        "preserve_format": preserve_format,
+        "duplicate_policy": duplicate_policy,
+        "sqlite_output": sqlite_output,
+        "ranking": ranking,
+        "max_empty_rows": max_empty_rows,
+        "extra_sheets": extra_sheets,
+        "compare": compare,
+    })
+    # 断点参数不一致或日志损坏时，暂存目录中上次中断写出的文件也不能沿用
+    resume = resume and read_journal(get_staging_dir(working_dir), signature) is not None
+
+    # 新结果写入同级暂存目录，成功后再整体替换"拆分"目录，读取者不会看到写到一半的结果
+    output_dir = prepare_staging(working_dir, resume)
+    cleanup_old_generations(working_dir)
+    checkpoint = Checkpoint(output_dir, signature, resume)
+
+    total_files = len(selected_files)
+    print(f"开始处理 {total_files} 个文件...")
+    
+    on_event, resumed = make_extraction_handler(total_files)
+    
+    inputs = [(file, os.path.join(working_dir, file)) for file in selected_files]
+    data = extract_and_merge(inputs, sheet_index, header_row, class_col, student_id_col, ignore_class_col,
+                             row_filters, statistics, wide_sheet, sheet_cache, checkpoint, on_event,
+                             partitions=partitions, preserve_format=preserve_format,
+                             duplicate_policy=duplicate_policy, keep_student_ids=bool(sqlite_output or compare), ranking=ranking,
+                             max_empty_rows=max_empty_rows, extra_sheets=extra_sheets, executor=executor)
+    stats = data.stats
+    
+    # 与上次考试按 (学科, 学号) 连接，previous 为已读取的上次考试数据
+    if compare:
+        data.comparison = Comparison(data, previous, normalize_compare_config(compare))
+    
+    if resumed:
+        print(f"\n从断点恢复了 {len(resumed)} 个文件的提取结果")
+    
+    print("\n数据提取完成，正在生成班级文件...")
+    
+    save_class_files(data, output_dir, show_subject_header, checkpoint)
+    if sqlite_output:
+        write_sqlite(data, os.path.join(output_dir, sqlite_output))
     
-    print("\n所有班级文件保存完成!")
-    return stats
\ No newline at end of file
+    checkpoint.finish()
+    # 旧结果目录在后台删除；覆盖模式下保留本次未生成的旧文件
+    stats["unreplaced_files"] = len(commit_staging(working_dir, keep_existing=existing_files_action == "overwrite"))
+    if not stats["unreplaced_files"]:
+        print("\n所有班级文件保存完成!")
+    return stats
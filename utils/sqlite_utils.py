@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+数据库输出工具模块
+把合并后的成绩数据写入本地SQLite数据库，每个学科一张表，便于直接用SQL查询，
+不必再重新导入各班的xlsx文件。所有数据在一个事务中批量插入
+"""
+
+import os
+import sqlite3
+from datetime import date, datetime, time
+
+
+CLASS_COLUMN = "班级"
+STUDENT_ID_COLUMN = "学号"
+
+
+def _quote(name):
+    # SQLite标识符用双引号包围，内部的双引号需要重复
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _column_names(header, reserved):
+    """
+    根据表头生成不重复的列名，空表头用列号代替
+    :param header: 学科表头
+    :param reserved: 已占用的列名（班级、学号）
+    :return: 列名列表
+    """
+    used = {name.lower() for name in reserved}
+    names = []
+    for i, cell in enumerate(header):
+        base = str(cell).strip() if cell is not None and str(cell).strip() else f"列{i + 1}"
+        name = base
+        suffix = 2
+        while name.lower() in used:
+            name = f"{base}_{suffix}"
+            suffix += 1
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+def _adapt(value):
+    # 日期时间保存为ISO格式文本，其他不支持的类型保存为文本
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _iter_subject_rows(data, subject, width, with_ids):
+    # 逐行产生 (班级, [学号,] 各列值)，行长度按表头补齐或截断
+    for class_name, subjects in data.class_data.items():
+        rows = subjects.get(subject)
+        if not rows:
+            continue
+        ids = data.student_ids.get(class_name, {}).get(subject) if with_ids else None
+        for i, row in enumerate(rows):
+            values = [_adapt(v) for v in row[:width]]
+            if len(values) < width:
+                values.extend([None] * (width - len(values)))
+            if with_ids:
+                values.insert(0, ids[i] if ids is not None else None)
+            values.insert(0, class_name)
+            yield values
+
+
+def write_sqlite(data, db_path):
+    """
+    将合并后的数据写入SQLite数据库，已存在的数据库会被替换
+    :param data: 已 finalize 的 SplitData
+    :param db_path: 数据库文件路径
+    :return: 写入的总行数
+    """
+    # 先写临时文件再替换，中断时不会留下不完整的数据库
+    part_path = db_path + ".part"
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    with_ids = bool(data.student_ids)
+    total = 0
+    conn = sqlite3.connect(part_path)
+    try:
+        # 临时文件写完才会替换，不需要日志和同步
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        with conn:
+            for subject, header in data.subject_headers.items():
+                reserved = [CLASS_COLUMN, STUDENT_ID_COLUMN] if with_ids else [CLASS_COLUMN]
+                columns = reserved + _column_names(header, reserved)
+                table = _quote(subject)
+                conn.execute(f"CREATE TABLE {table} ({', '.join(_quote(c) for c in columns)})")
+                placeholders = ", ".join("?" * len(columns))
+                cursor = conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})",
+                                          _iter_subject_rows(data, subject, len(header), with_ids))
+                total += cursor.rowcount
+                # 数据插入完成后再建索引，比边插入边维护索引快
+                for column in reserved:
+                    index = _quote(f"idx_{subject}_{column}")
+                    conn.execute(f"CREATE INDEX {index} ON {table} ({_quote(column)})")
+    finally:
+        conn.close()
+
+    os.replace(part_path, db_path)
+    print(f"\n数据库已保存: {os.path.basename(db_path)}，共 {total} 行")
+    return total
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+成绩统计工具模块
+在提取数据的同时用流式累加器统计各班各学科的平均分、最高分、最低分、及格率和分数段分布，
+并在班级文件中写入统计sheet
+"""
+
+from utils.multi_sheet_utils import SHEET_NAME_SEPARATOR
+
+
+SUMMARY_SHEET_TITLE = "统计"
+
+DEFAULT_STATISTICS = {
+    "pass_score": 60,
+    "bucket_size": 10,
+    "columns": None,
+}
+
+# 按学科设置及格线时，未列出的学科使用该键对应的及格线
+DEFAULT_PASS_SCORE_KEY = "default"
+
+# 累加器各字段的下标
+_COUNT, _TOTAL, _MIN, _MAX, _PASSED, _BUCKETS = range(6)
+
+
+def _is_number(value):
+    return score_value(value) is not None
+
+
+def normalize_statistics_config(statistics, default_column=None):
+    """
+    规范化统计配置
+    :param statistics: True、False/None 或包含 pass_score、bucket_size、columns 的字典；
+                       pass_score 可以是数值，也可以是 {学科: 及格线} 的字典（"default" 为其他学科的及格线）
+    :param default_column: 可选，未指定 columns 时统计的成绩列名（通常为排名所用的成绩列）
+    :return: 完整的配置字典；不需要统计时返回None
+    """
+    if not statistics:
+        return None
+    config = dict(DEFAULT_STATISTICS)
+    if isinstance(statistics, dict):
+        config.update({k: v for k, v in statistics.items() if k in DEFAULT_STATISTICS})
+    if not _is_number(config["bucket_size"]) or config["bucket_size"] <= 0:
+        raise ValueError("统计配置中的 bucket_size 必须大于0")
+
+    # 学号、班级等数值列不是成绩，必须明确统计哪些列
+    if not config["columns"]:
+        if not default_column:
+            raise ValueError("统计配置需要用 columns 指定成绩列名，或同时配置排名以统计排名所用的成绩列")
+        config["columns"] = [default_column]
+    elif not isinstance(config["columns"], list):
+        raise ValueError(f"统计配置中的 columns 必须是列名列表: {config['columns']}")
+
+    # 满分不同的学科（如150分制的语数外）需要各自的及格线
+    pass_score = config["pass_score"]
+    scores = pass_score.values() if isinstance(pass_score, dict) else [pass_score]
+    if not all(_is_number(score) for score in scores):
+        raise ValueError(f"统计配置中的 pass_score 必须是数值或 {{学科: 数值}} 字典: {pass_score}")
+    return config
+
+
+def score_value(value):
+    """
+    判断单元格是否为成绩，统计、排名和对比共用
+    :param value: 单元格的值
+    :return: 数值单元格原样返回，其他返回None；bool虽是int的子类但不是成绩
+    """
+    return value if type(value) is int or type(value) is float else None
+
+
+def _new_acc():
+    return [0, 0.0, None, None, 0, {}]
+
+
+def _merge_acc(target, source):
+    target[_COUNT] += source[_COUNT]
+    target[_TOTAL] += source[_TOTAL]
+    if source[_MIN] is not None and (target[_MIN] is None or source[_MIN] < target[_MIN]):
+        target[_MIN] = source[_MIN]
+    if source[_MAX] is not None and (target[_MAX] is None or source[_MAX] > target[_MAX]):
+        target[_MAX] = source[_MAX]
+    target[_PASSED] += source[_PASSED]
+    buckets = target[_BUCKETS]
+    for bucket, count in source[_BUCKETS].items():
+        buckets[bucket] = buckets.get(bucket, 0) + count
+
+
+class StatsAccumulator:
+    """按 (班级, 学科) 和列累加数值单元格，只保存计数和汇总值而不保存原始数据"""
+
+    def __init__(self, pass_score=60, bucket_size=10, columns=None):
+        self.pass_score = pass_score
+        self.bucket_size = bucket_size
+        self.columns = set(columns) if columns else None
+        self.data = {}
+        self._pass_scores = {}
+
+    def pass_score_for(self, subject):
+        """
+        获取学科的及格线，额外sheet（如"数学-赋分"）未单独设置时使用对应学科的及格线
+        :param subject: 学科名
+        :return: 及格分数
+        """
+        score = self._pass_scores.get(subject)
+        if score is None:
+            scores = self.pass_score
+            if not isinstance(scores, dict):
+                score = scores
+            else:
+                base = subject.split(SHEET_NAME_SEPARATOR, 1)[0]
+                score = scores.get(subject, scores.get(base, scores.get(DEFAULT_PASS_SCORE_KEY,
+                                                                          DEFAULT_STATISTICS["pass_score"])))
+            self._pass_scores[subject] = score
+        return score
+
+    def select_columns(self, header):
+        """
+        根据表头确定需要统计的列
+        :param header: 投影后的表头
+        :return: 列下标列表；未限定列时返回None（统计所有数值列）
+        """
+        if self.columns is None:
+            return None
+        return [i for i, name in enumerate(header) if name in self.columns]
+
+    def add(self, key, row, column_indexes=None):
+        """
+        累加一行数据
+        :param key: (班级, 学科)
+        :param row: 投影后的数据行
+        :param column_indexes: select_columns 的结果
+        """
+        columns = self.data.get(key)
+        if columns is None:
+            columns = self.data[key] = {}
+        indexes = range(len(row)) if column_indexes is None else column_indexes
+        pass_score = self.pass_score_for(key[1])
+        for i in indexes:
+            # 只统计数值单元格
+            value = score_value(row[i]) if i < len(row) else None
+            if value is None:
+                continue
+            acc = columns.get(i)
+            if acc is None:
+                acc = columns[i] = _new_acc()
+            acc[_COUNT] += 1
+            acc[_TOTAL] += value
+            if acc[_MIN] is None or value < acc[_MIN]:
+                acc[_MIN] = value
+            if acc[_MAX] is None or value > acc[_MAX]:
+                acc[_MAX] = value
+            if value >= pass_score:
+                acc[_PASSED] += 1
+            bucket = int(value // self.bucket_size)
+            acc[_BUCKETS][bucket] = acc[_BUCKETS].get(bucket, 0) + 1
+
+    def merge(self, other):
+        """合并另一个累加器（通常来自单个文件的工作线程）"""
+        for key, columns in other.data.items():
+            target_columns = self.data.setdefault(key, {})
+            for i, acc in columns.items():
+                target = target_columns.get(i)
+                if target is None:
+                    target_columns[i] = [acc[_COUNT], acc[_TOTAL], acc[_MIN], acc[_MAX], acc[_PASSED], dict(acc[_BUCKETS])]
+                else:
+                    _merge_acc(target, acc)
+
+    def to_data(self):
+        """
+        转换为只包含基本类型的字典，用于保存中间文件
+        :return: 字典
+        """
+        return {
+            "pass_score": self.pass_score,
+            "bucket_size": self.bucket_size,
+            "columns": list(self.columns) if self.columns is not None else None,
+            "data": [[class_name, subject,
+                      [[i] + acc[:_BUCKETS] + [list(acc[_BUCKETS].items())] for i, acc in columns.items()]]
+                     for (class_name, subject), columns in self.data.items()],
+        }
+
+    @classmethod
+    def from_data(cls, state):
+        """
+        从 to_data 的结果恢复
+        :param state: to_data 的结果
+        :return: StatsAccumulator
+        """
+        accumulator = cls(state["pass_score"], state["bucket_size"], state["columns"])
+        for class_name, subject, columns in state["data"]:
+            target = accumulator.data[(class_name, subject)] = {}
+            for i, count, total, low, high, passed, buckets in columns:
+                target[i] = [count, total, low, high, passed, {bucket: n for bucket, n in buckets}]
+        return accumulator
+
+    def grade_totals(self):
+        """
+        汇总所有班级得到年级基准
+        :return: {学科: {列下标: 累加值}}
+        """
+        grade = {}
+        for (_, subject), columns in self.data.items():
+            target_columns = grade.setdefault(subject, {})
+            for i, acc in columns.items():
+                target = target_columns.setdefault(i, _new_acc())
+                _merge_acc(target, acc)
+        return grade
+
+    def _bucket_label(self, bucket):
+        low = bucket * self.bucket_size
+        return f"{low:g}-{low + self.bucket_size:g}"
+
+    def write_summary_sheet(self, out_wb, cls, subjects, subject_headers, grade):
+        """
+        在班级工作簿中追加统计sheet
+        :param out_wb: write_only 模式的班级工作簿
+        :param cls: 班级名
+        :param subjects: 按输出顺序排列的学科列表
+        :param subject_headers: 学科表头
+        :param grade: grade_totals 的结果
+        """
+        ws = out_wb.create_sheet(title=SUMMARY_SHEET_TITLE)
+        ws.append(["学科", "项目", "人数", "平均分", "最高分", "最低分", "及格率",
+                   "年级平均分", "年级最高分", "年级最低分", "年级及格率"])
+        distribution = []
+        for subject in subjects:
+            columns = self.data.get((cls, subject), {})
+            header = subject_headers.get(subject, ())
+            for i in sorted(columns):
+                acc = columns[i]
+                grade_acc = grade.get(subject, {}).get(i, acc)
+                name = header[i] if i < len(header) and header[i] is not None else f"列{i + 1}"
+                ws.append([
+                    subject, name, acc[_COUNT],
+                    round(acc[_TOTAL] / acc[_COUNT], 2), acc[_MAX], acc[_MIN],
+                    round(acc[_PASSED] / acc[_COUNT], 4),
+                    round(grade_acc[_TOTAL] / grade_acc[_COUNT], 2), grade_acc[_MAX], grade_acc[_MIN],
+                    round(grade_acc[_PASSED] / grade_acc[_COUNT], 4),
+                ])
+                for bucket in sorted(grade_acc[_BUCKETS]):
+                    distribution.append([subject, name, self._bucket_label(bucket),
+                                         acc[_BUCKETS].get(bucket, 0), grade_acc[_BUCKETS][bucket]])
+        if distribution:
+            ws.append([])
+            ws.append(["学科", "项目", "分数段", "班级人数", "年级人数"])
+            for row in distribution:
+                ws.append(row)